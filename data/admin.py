@@ -1,4 +1,5 @@
-from data.models import User, Category, Item, Reservation, Claim, Location
+from data.models import catalog_version, User, Category, Item, ItemKeyword, Reservation, \
+        ReservationKeyword, Claim, Location, Notification
 from django.contrib import admin
 
 class LocationAdmin(admin.ModelAdmin):
@@ -41,6 +42,22 @@ class ItemAdmin(admin.ModelAdmin):
         )
     ]
     list_display = ['name', 'category', 'claimed', 'seller_user', 'price']
+
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            # generate_thumbnails makes the copies of the new image
+            obj.thumbnails_ready = False
+            obj.thumbnails_failed = False
+        obj.save()
+        # keep the search index in sync with admin edits
+        if obj.claimed:
+            ItemKeyword.unindex_item(obj)
+        else:
+            ItemKeyword.index_item(obj)
+        catalog_version.bump()
+
+    def delete_model(self, request, obj):
+        Item.delete_item(obj)
 admin.site.register(Item, ItemAdmin)
 
 class ReservationAdmin(admin.ModelAdmin):
@@ -48,6 +65,10 @@ class ReservationAdmin(admin.ModelAdmin):
         (None, {'fields': ['user', 'search_query', 'max_price', 'timestamp']})
     ]
     list_display = ['user', 'search_query', 'timestamp']
+
+    def save_model(self, request, obj, form, change):
+        obj.save()
+        ReservationKeyword.index_reservation(obj)
 admin.site.register(Reservation, ReservationAdmin)
 
 class ClaimAdmin(admin.ModelAdmin):
@@ -55,5 +76,18 @@ class ClaimAdmin(admin.ModelAdmin):
         (None, {'fields': ['buyer', 'item']})
     ]
     list_display = ['buyer', 'item']
+
+    def delete_model(self, request, obj):
+        # puts the item back on the buy page
+        Claim.delete_claim(obj)
 admin.site.register(Claim, ClaimAdmin)
 
+
+class NotificationAdmin(admin.ModelAdmin):
+    fieldsets = [
+        (None, {'fields': ['user', 'channel', 'subject', 'message']}),
+        ('Delivery', {'fields': ['status', 'attempts', 'next_attempt', 'last_error']}),
+    ]
+    list_display = ['user', 'channel', 'subject', 'status', 'attempts', 'timestamp']
+    list_filter = ['status', 'channel']
+admin.site.register(Notification, NotificationAdmin)
@@ -0,0 +1,217 @@
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.test.client import Client
+
+from data.models import bulk_insert, in_id_batches, catalog_version, Location, User, \
+        Category, Item, ItemKeyword, Reservation, ReservationKeyword, Claim
+
+# get_current_user always resolves to this user
+CURRENT_USERNAME = 'pwh'
+
+WORDS = ['textbook', 'chair', 'desk', 'lamp', 'couch', 'poster', 'jeans', 'shirt',
+    'calculator', 'laptop', 'monitor', 'keyboard', 'fridge', 'microwave', 'kettle',
+    'bike', 'helmet', 'clicker', 'notes', 'tickets', 'speaker', 'headphones', 'mug',
+    'blender', 'rug', 'mirror', 'shelf', 'printer', 'cable', 'charger', 'used', 'new',
+    'blue', 'red', 'wooden', 'broken', 'vintage', 'large', 'small', 'cheap']
+COURSES = ['3.091', '5.111', '5.112', '8.01', '8.02', '18.01', '18.02', '6.01', '7.012',
+    '6.042', '18.06', '14.01', '21W.785']
+CENTER = (42.3591, -71.0935)
+
+def percentile(values, p):
+    ''' nearest-rank percentile of a sorted list '''
+    if not values:
+        return None
+    index = max(0, int(math.ceil(p / 100.0 * len(values))) - 1)
+    return values[min(index, len(values) - 1)]
+
+class Benchmark(object):
+    '''
+    fills the database with synthetic data and times Geddit's hot paths.
+    Meant to run against a throwaway database, such as a test database.
+    The Django cache is given a key prefix of its own for the run, so the
+    synthetic listings and catalog versions stay out of the site's cache.
+
+    The buy page is timed with its listings cache cold, as after a catalog
+    change, and once more warm as buy_page_cached.
+    '''
+    def __init__(self, users=200, locations=20, categories=20, items=5000, \
+            reservations=1000, claims=500, iterations=50, seed=0):
+        self.sizes = {
+            'users': users,
+            'locations': locations,
+            'categories': categories,
+            'items': items,
+            'reservations': reservations,
+            'claims': claims,
+        }
+        self.iterations = iterations
+        self.random = random.Random(seed)
+
+    def words(self, count):
+        words = [self.random.choice(WORDS) for i in range(count)]
+        if self.random.random() < 0.5:
+            words.insert(0, self.random.choice(COURSES))
+        return ' '.join(words)
+
+    def generate(self):
+        sizes = self.sizes
+        locations = []
+        for i in range(sizes['locations']):
+            location = Location(name='Dorm %d' % i, \
+                    latitude=Decimal('%.6f' % (CENTER[0] + self.random.uniform(-0.01, 0.01))), \
+                    longitude=Decimal('%.6f' % (CENTER[1] + self.random.uniform(-0.01, 0.01))))
+            location.update_coordinates()
+            locations.append(location)
+        bulk_insert(Location, locations)
+        location_ids = list(Location.objects.values_list('id', flat=True))
+
+        users = [User(username=CURRENT_USERNAME, first_name='Current', last_name='User', \
+                email=CURRENT_USERNAME + '@mit.edu', location_id=location_ids[0])]
+        for i in range(1, sizes['users']):
+            users.append(User(username='user%d' % i, first_name='User', last_name=str(i), \
+                    email='user%d@mit.edu' % i, location_id=self.random.choice(location_ids), \
+                    sms_notifications=self.random.random() < 0.2))
+        bulk_insert(User, users)
+        user_ids = list(User.objects.values_list('id', flat=True))
+
+        bulk_insert(Category, [Category(name='Category %d' % i) \
+                for i in range(sizes['categories'])])
+        category_ids = list(Category.objects.values_list('id', flat=True))
+
+        start = datetime.utcnow() - timedelta(days=90)
+        items = []
+        for i in range(sizes['items']):
+            items.append(Item(seller_user_id=self.random.choice(user_ids), \
+                    name=self.words(3), description=self.words(8), claimed=False, \
+                    category_id=self.random.choice(category_ids), \
+                    upload_time=start + timedelta(seconds=self.random.randint(0, 90 * 86400)), \
+                    price=Decimal('%.2f' % self.random.uniform(1, 200))))
+        bulk_insert(Item, items)
+        for batch in in_id_batches(Item.objects.all()):
+            ItemKeyword.index_items(batch)
+
+        bulk_insert(Reservation, [Reservation(user_id=self.random.choice(user_ids), \
+                search_query=self.words(1), \
+                max_price=Decimal('%.2f' % self.random.uniform(1, 200))) \
+                for i in range(sizes['reservations'])])
+        for batch in in_id_batches(Reservation.objects.all()):
+            ReservationKeyword.index_reservations(batch)
+
+        item_ids = list(Item.objects.values_list('id', flat=True))
+        claimed = self.random.sample(item_ids, min(sizes['claims'], len(item_ids)))
+        bulk_insert(Claim, [Claim(buyer_id=self.random.choice(user_ids), item_id=item_id) \
+                for item_id in claimed])
+        for i in range(0, len(claimed), 500):
+            Item.objects.filter(id__in=claimed[i:i + 500]).update(claimed=True)
+            ItemKeyword.objects.filter(item__in=claimed[i:i + 500]).delete()
+
+    def measure(self, name, operation, prepare=None):
+        '''
+        runs operation iterations times, recording latency and query counts.
+        prepare runs untimed before each iteration.
+        '''
+        latencies = []
+        queries = []
+        for i in range(self.iterations):
+            if prepare is not None:
+                prepare(i)
+            reset_queries()
+            start = time.time()
+            operation(i)
+            latencies.append(time.time() - start)
+            queries.append(len(connection.queries))
+        latencies.sort()
+        return name, {
+            'count': len(latencies),
+            'mean_ms': 1000 * sum(latencies) / len(latencies),
+            'p50_ms': 1000 * percentile(latencies, 50),
+            'p95_ms': 1000 * percentile(latencies, 95),
+            'p99_ms': 1000 * percentile(latencies, 99),
+            'queries_mean': float(sum(queries)) / len(queries),
+            'queries_max': max(queries),
+        }
+
+    def run(self):
+        old_key_prefix = cache.key_prefix
+        cache.key_prefix = 'geddit-benchmark-' + uuid.uuid4().hex
+        try:
+            return self.run_isolated()
+        finally:
+            cache.key_prefix = old_key_prefix
+
+    def run_isolated(self):
+        self.generate()
+        client = Client()
+        current_user = User.get_user(CURRENT_USERNAME)
+        category_names = list(Category.objects.values_list('name', flat=True))
+        unclaimed_ids = list(Item.objects.filter(claimed=False).values_list('id', flat=True))
+        buyer = User.objects.exclude(id=current_user.id)[0]
+        results = {}
+
+        def search(keywords):
+            def operation(i):
+                client.get('/buy', {'search_query': self.words(keywords)})
+            return operation
+
+        def add_item(i):
+            current_user.add_item(self.words(3), self.words(8), \
+                    Category.get_category(self.random.choice(category_names)), \
+                    '%.2f' % self.random.uniform(1, 200))
+
+        def claim_and_unclaim(i):
+            item = Item.get_item_by_id(self.random.choice(unclaimed_ids))
+            if item.claimed:
+                return
+            buyer.add_claim(item)
+            buyer.remove_claim(item)
+
+        def cold(i):
+            catalog_version.bump()
+
+        old_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        try:
+            for name, operation, prepare in [
+                    ('buy_page', lambda i: client.get('/buy'), cold),
+                    ('buy_page_cached', lambda i: client.get('/buy'), None),
+                    ('buy_page_category', lambda i: client.get('/buy', \
+                            {'category': self.random.choice(category_names)}), cold),
+                    ('buy_page_search_1', search(1), cold),
+                    ('buy_page_search_3', search(3), cold),
+                    ('add_item', add_item, None),
+                    ('dashboard_page', lambda i: client.get('/dashboard'), None),
+                    ('claim_unclaim', claim_and_unclaim, None)]:
+                name, result = self.measure(name, operation, prepare)
+                results[name] = result
+        finally:
+            connection.use_debug_cursor = old_debug_cursor
+        return {
+            'timestamp': datetime.utcnow().isoformat(),
+            'sizes': self.sizes,
+            'iterations': self.iterations,
+            'results': results,
+        }
+
+def compare(results, baseline, threshold):
+    '''
+    returns [(operation, metric, baseline, current, change)] for every p50/p95
+    latency or query count that grew by more than threshold (0.1 is 10%)
+    '''
+    regressions = []
+    for name, current in sorted(results['results'].items()):
+        previous = baseline['results'].get(name, None)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'queries_mean'):
+            if previous[metric] and \
+                    (current[metric] - previous[metric]) / previous[metric] > threshold:
+                regressions.append((name, metric, previous[metric], current[metric], \
+                        (current[metric] - previous[metric]) / previous[metric]))
+    return regressions
@@ -0,0 +1,123 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+def is_shared():
+    '''
+    whether a value in the Django cache is seen by every process serving
+    the site: the cache is shared (memcached), or SINGLE_PROCESS says there
+    is only the one process
+    '''
+    if getattr(settings, 'SINGLE_PROCESS', False):
+        return True
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+class CacheVersion(object):
+    '''
+    a version number kept in the Django cache. Anything cached under the
+    current version is invalidated by bump(), in every process if the
+    cache is shared. If the shared cache forgets the version, a new one is
+    picked.
+    '''
+    def __init__(self, name):
+        self.key = 'geddit:version:' + name
+
+    def get(self):
+        version = cache.get(self.key)
+        if version is None:
+            cache.add(self.key, int(time.time() * 1000))
+            version = cache.get(self.key)
+        return version
+
+    def bump(self):
+        ''' returns the new version '''
+        try:
+            return cache.incr(self.key)
+        except ValueError:
+            cache.add(self.key, int(time.time() * 1000))
+            return cache.get(self.key)
+
+class VersionedCache(object):
+    '''
+    process-local copy of a value that rarely changes.
+
+    The version number lives in the Django cache. When that cache is
+    shared (see is_shared), bump() in one process invalidates the copies
+    held by every process. With a process-local cache it only reaches the
+    copy in the process that bumped. If the cache forgets the version, a
+    new one is picked and every copy reloads.
+    '''
+    def __init__(self, name, loader):
+        self.cache_version = CacheVersion(name)
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.version = None
+        self.value = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_version(self):
+        return self.cache_version.get()
+
+    def bump(self):
+        self.cache_version.bump()
+
+    def get(self):
+        version = self.get_version()
+        with self.lock:
+            if version is not None and version == self.version:
+                self.hits += 1
+                return self.value
+            self.misses += 1
+        value = self.loader()
+        with self.lock:
+            self.value = value
+            self.version = version
+        return value
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+class FragmentCache(object):
+    '''
+    values, such as rendered HTML, kept in the shared Django cache for as
+    long as a CacheVersion stays the same. The version is read before the
+    value is built, so a value built from data that changed before the
+    bump is never stored under the version that follows it.
+
+    Without a shared cache a bump in one process wouldn't reach the copies
+    kept by the others, so nothing is cached and every get() builds.
+    '''
+    def __init__(self, name, cache_version, timeout=300):
+        self.name = name
+        self.cache_version = cache_version
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, version, key):
+        # memcached keys are short and can't hold spaces
+        return 'geddit:%s:%s:%s' % (self.name, version, \
+                hashlib.md5(key.encode('utf-8')).hexdigest())
+
+    def get(self, key, build):
+        if not is_shared():
+            self.misses += 1
+            return build()
+        cache_key = self.make_key(self.cache_version.get(), key)
+        value = cache.get(cache_key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = build()
+        cache.set(cache_key, value, self.timeout)
+        return value
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
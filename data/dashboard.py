@@ -0,0 +1,48 @@
+from collections import namedtuple
+
+from data.models import Item, Claim, Reservation
+
+ReservationRow = namedtuple('ReservationRow', ['id', 'search_query', 'max_price'])
+
+ClaimRow = namedtuple('ClaimRow', ['item_id', 'name', 'description', 'price', \
+        'thumbnail_url', 'medium_url', 'location', 'seller_email'])
+
+ListingRow = namedtuple('ListingRow', ['id', 'name', 'description', 'price', \
+        'thumbnail_url', 'medium_url'])
+
+Dashboard = namedtuple('Dashboard', ['reservations', 'claims', 'items'])
+
+def image_urls(image, thumbnails_ready, thumbnails_version):
+    return Item.image_url(image, thumbnails_ready, thumbnails_version, 'thumb'), \
+            Item.image_url(image, thumbnails_ready, thumbnails_version, 'medium')
+
+def load_dashboard(user):
+    '''
+    everything the dashboard shows for user, in three queries however many
+    reservations, claims and listings the user has. The rows are tuples of
+    the columns the templates use, with the related rows already joined in.
+    '''
+    reservations = [ReservationRow(*row) for row in Reservation.objects \
+            .filter(user=user).order_by('-timestamp') \
+            .values_list('id', 'search_query', 'max_price')]
+
+    claims = []
+    for item_id, name, description, price, image, thumbnails_ready, thumbnails_version, \
+            location, seller_email in Claim.objects.filter(buyer=user) \
+                .order_by('-timestamp').values_list( \
+                    'item_id', 'item__name', 'item__description', 'item__price', \
+                    'item__image', 'item__thumbnails_ready', 'item__thumbnails_version', \
+                    'item__seller_user__location__name', 'item__seller_user__email'):
+        thumbnail_url, medium_url = image_urls(image, thumbnails_ready, thumbnails_version)
+        claims.append(ClaimRow(item_id, name, description, price, thumbnail_url, medium_url, \
+                location, seller_email))
+
+    items = []
+    for id, name, description, price, image, thumbnails_ready, thumbnails_version \
+            in Item.objects.filter(seller_user=user).order_by('id').values_list('id', \
+                    'name', 'description', 'price', 'image', 'thumbnails_ready', \
+                    'thumbnails_version'):
+        thumbnail_url, medium_url = image_urls(image, thumbnails_ready, thumbnails_version)
+        items.append(ListingRow(id, name, description, price, thumbnail_url, medium_url))
+
+    return Dashboard(tuple(reservations), tuple(claims), tuple(items))
@@ -0,0 +1,173 @@
+import csv
+import json
+from cStringIO import StringIO
+from datetime import datetime
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+
+from data.models import in_id_batches, Category, Item, Claim, Reservation
+
+DATE_FORMATS = ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+class ExportError(Exception):
+    pass
+
+def parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise ExportError('Unrecognized date "%s"' % value)
+
+# for each kind of export: the queryset, the column that dates filter on,
+# the path to the category (None if the rows have none) and the columns
+EXPORTS = {
+    'items': (
+        lambda: Item.objects.select_related('category', 'seller_user'),
+        'upload_time',
+        'category',
+        [
+            ('id', lambda item: item.id),
+            ('name', lambda item: item.name),
+            ('description', lambda item: item.description),
+            ('category', lambda item: item.category.name),
+            ('seller', lambda item: item.seller_user.username),
+            ('price', lambda item: item.price),
+            ('claimed', lambda item: item.claimed),
+            ('upload_time', lambda item: item.upload_time),
+        ],
+    ),
+    'claims': (
+        lambda: Claim.objects.select_related('buyer', 'item__category', 'item__seller_user'),
+        'timestamp',
+        'item__category',
+        [
+            ('id', lambda claim: claim.id),
+            ('item_id', lambda claim: claim.item_id),
+            ('item', lambda claim: claim.item.name),
+            ('category', lambda claim: claim.item.category.name),
+            ('seller', lambda claim: claim.item.seller_user.username),
+            ('buyer', lambda claim: claim.buyer.username),
+            ('price', lambda claim: claim.item.price),
+            ('timestamp', lambda claim: claim.timestamp),
+        ],
+    ),
+    'reservations': (
+        lambda: Reservation.objects.select_related('user'),
+        'timestamp',
+        None,
+        [
+            ('id', lambda reservation: reservation.id),
+            ('user', lambda reservation: reservation.user.username),
+            ('search_query', lambda reservation: reservation.search_query),
+            ('max_price', lambda reservation: reservation.max_price),
+            ('timestamp', lambda reservation: reservation.timestamp),
+        ],
+    ),
+}
+
+def get_rows(kind, start=None, end=None, category=None, batch_size=500):
+    '''
+    returns an iterator over the rows of an export as lists of values. The
+    rows are read batch_size at a time by id, so memory use doesn't grow
+    with the table. start and end limit the dates to [start, end);
+    category is a Category.
+    '''
+    if kind not in EXPORTS:
+        raise ExportError('Unknown export "%s"' % kind)
+    get_queryset, date_field, category_field, columns = EXPORTS[kind]
+    queryset = get_queryset()
+    if start is not None:
+        queryset = queryset.filter(**{date_field + '__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{date_field + '__lt': end})
+    if category is not None:
+        if category_field is None:
+            raise ExportError('%s have no category' % kind.capitalize())
+        queryset = queryset.filter(**{category_field: category})
+
+    return read_rows(queryset, [getter for name, getter in columns], batch_size)
+
+def read_rows(queryset, getters, batch_size):
+    for batch in in_id_batches(queryset, batch_size):
+        for obj in batch:
+            yield [getter(obj) for getter in getters]
+
+def to_text(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return value
+    if value is None or isinstance(value, (int, long)):
+        return value
+    return unicode(value)
+
+def write_ndjson(columns, rows):
+    ''' one JSON object per line '''
+    names = [name for name, getter in columns]
+    for row in rows:
+        yield json.dumps(dict(zip(names, [to_text(value) for value in row]))) + '\n'
+
+def write_csv(columns, rows, rows_per_chunk=100):
+    ''' a header line, then the rows, rows_per_chunk rows to a chunk '''
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, getter in columns])
+    count = 0
+    for row in rows:
+        writer.writerow([unicode(to_text(value)).encode('utf-8') for value in row])
+        count += 1
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+WRITERS = {
+    'csv': write_csv,
+    'ndjson': write_ndjson,
+}
+
+def export(kind, format, start=None, end=None, category=None):
+    '''
+    returns an iterator over the chunks of an export in format ('csv' or
+    'ndjson'). Nothing is read from the database until it is iterated.
+    '''
+    if format not in WRITERS:
+        raise ExportError('Unknown format "%s"' % format)
+    if kind not in EXPORTS:
+        raise ExportError('Unknown export "%s"' % kind)
+    return WRITERS[format](EXPORTS[kind][3], get_rows(kind, start, end, category))
+
+def export_filters(params):
+    ''' the start, end and category named by request or command parameters '''
+    filters = {}
+    for name in ('start', 'end'):
+        if params.get(name, None):
+            filters[name] = parse_date(params[name])
+    if params.get('category', None):
+        try:
+            filters['category'] = Category.get_category(params['category'])
+        except Category.DoesNotExist:
+            raise ExportError('Unknown category "%s"' % params['category'])
+    return filters
+
+@staff_member_required
+def serve_export(request, kind, format):
+    ''' streams an export to an admin, filtered by the start, end and category parameters '''
+    if kind not in EXPORTS or format not in WRITERS:
+        raise Http404('No such export')
+    try:
+        chunks = export(kind, format, **export_filters(request.GET))
+    except ExportError, e:
+        return HttpResponseBadRequest(str(e))
+    response = HttpResponse(chunks, content_type=CONTENT_TYPES[format])
+    response['Content-Disposition'] = 'attachment; filename=%s.%s' % (kind, format)
+    return response
@@ -0,0 +1,29 @@
+import math
+
+EARTH_RADIUS_METERS = 6371000.0
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_METERS / 180.0
+
+# side of a grid cell, roughly 550m north-south
+GRID_CELL_DEGREES = 0.005
+
+def grid_cell(lat, lng):
+    ''' returns the (row, column) of the grid cell containing the point '''
+    return int(math.floor(lat / GRID_CELL_DEGREES)), int(math.floor(lng / GRID_CELL_DEGREES))
+
+def grid_span(lat, radius):
+    '''
+    returns how many cells (rows, columns) away from the center a point
+    within radius meters of latitude lat can be
+    '''
+    lat_degrees = radius / METERS_PER_DEGREE
+    # a degree of longitude shrinks away from the equator
+    lng_degrees = lat_degrees / max(math.cos(math.radians(lat)), 0.01)
+    return int(math.ceil(lat_degrees / GRID_CELL_DEGREES)), \
+            int(math.ceil(lng_degrees / GRID_CELL_DEGREES))
+
+def distance(lat1, lng1, lat2, lng2):
+    ''' great-circle distance between two points, in meters '''
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+            math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
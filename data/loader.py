@@ -0,0 +1,191 @@
+import csv
+import json
+import os
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from data.models import bulk_insert, in_id_batches, catalog_version, category_cache, \
+        location_cache, Location, User, Category, Item, ItemKeyword
+
+# the order rows are inserted in, so that references can be resolved
+MODELS = ['location', 'category', 'user', 'item']
+
+TIME_FORMATS = ['%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']
+
+class LoadError(Exception):
+    pass
+
+def parse_time(value):
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format)
+        except ValueError:
+            pass
+    raise LoadError('Unrecognized timestamp "%s"' % value)
+
+def parse_decimal(value, what, where):
+    try:
+        number = Decimal(unicode(value).strip())
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite():
+        raise LoadError('%s: "%s" is not a valid %s' % (where, value, what))
+    return number
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return unicode(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+def model_for_path(path):
+    ''' users.csv -> 'user' '''
+    name = os.path.splitext(os.path.basename(path))[0].lower()
+    if name == 'categories':
+        return 'category'
+    if name.endswith('s'):
+        name = name[:-1]
+    if name not in MODELS:
+        raise LoadError('Cannot tell what %s holds; pass --model' % path)
+    return name
+
+class BulkLoader(object):
+    '''
+    loads locations, categories, users and items from JSONL or CSV with
+    batched inserts. Items keep the upload_time they are given, and no
+    reservation matching or notification happens for them.
+
+    JSONL rows name their model in a "model" field. A CSV file holds one
+    model, named by the model argument or else by the file name. Users
+    refer to their location by name; items refer to their seller by
+    username and to their category by name. Usernames, location names and
+    category names that are already taken are errors.
+    '''
+    def __init__(self):
+        self.rows = dict((model, []) for model in MODELS)
+        self.counts = dict((model, 0) for model in MODELS)
+
+    def read(self, path, model=None):
+        with open(path, 'rb') as f:
+            if path.endswith('.csv'):
+                model = model or model_for_path(path)
+                for number, row in enumerate(csv.DictReader(f)):
+                    # the header is line 1
+                    self.add(model, dict((key, value.decode('utf-8')) \
+                            for key, value in row.items()), '%s:%d' % (path, number + 2))
+            else:
+                for number, line in enumerate(f):
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        raise LoadError('%s:%d is not valid JSON' % (path, number + 1))
+                    self.add(model or row.pop('model', None), row, \
+                            '%s:%d' % (path, number + 1))
+
+    def add(self, model, row, where):
+        ''' where is the file and line of the row, for error messages '''
+        if model not in self.rows:
+            raise LoadError('%s: unknown model "%s"' % (where, model))
+        self.rows[model].append((where, row))
+
+    def load(self):
+        with transaction.commit_on_success():
+            self.load_locations()
+            self.load_categories()
+            self.load_users()
+            self.load_items()
+        # bulk inserts don't send the signals that invalidate these
+        category_cache.bump()
+        location_cache.bump()
+        catalog_version.bump()
+        return self.counts
+
+    def lookup(self, model, key, values):
+        ''' maps key -> id for the rows of model whose key is in values '''
+        mapping = {}
+        values = list(set(values))
+        for i in range(0, len(values), 500):
+            mapping.update(model.objects.filter(**{key + '__in': values[i:i + 500]}) \
+                    .values_list(key, 'id'))
+        return mapping
+
+    def check_new(self, model, key, rows, what):
+        ''' raises LoadError for a key that is taken, in the database or by an earlier row '''
+        taken = self.lookup(model, key, [row[key] for where, row in rows])
+        seen = set()
+        for where, row in rows:
+            if row[key] in taken or row[key] in seen:
+                raise LoadError('%s: %s "%s" already exists' % (where, what, row[key]))
+            seen.add(row[key])
+
+    def resolve(self, mapping, value, what, where):
+        try:
+            return mapping[value]
+        except KeyError:
+            raise LoadError('%s: unknown %s "%s"' % (where, what, value))
+
+    def load_locations(self):
+        self.check_new(Location, 'name', self.rows['location'], 'location')
+        locations = []
+        for where, row in self.rows['location']:
+            location = Location(name=row['name'], \
+                    latitude=parse_decimal(row['latitude'], 'latitude', where), \
+                    longitude=parse_decimal(row['longitude'], 'longitude', where))
+            location.update_coordinates()
+            locations.append(location)
+        bulk_insert(Location, locations)
+        self.counts['location'] = len(locations)
+
+    def load_categories(self):
+        self.check_new(Category, 'name', self.rows['category'], 'category')
+        bulk_insert(Category, [Category(name=row['name']) \
+                for where, row in self.rows['category']])
+        self.counts['category'] = len(self.rows['category'])
+
+    def load_users(self):
+        rows = self.rows['user']
+        self.check_new(User, 'username', rows, 'username')
+        locations = self.lookup(Location, 'name', \
+                [row['location'] for where, row in rows if row.get('location')])
+        users = []
+        for where, row in rows:
+            location_id = None
+            if row.get('location'):
+                location_id = self.resolve(locations, row['location'], 'location', where)
+            users.append(User(username=row['username'], first_name=row['first_name'], \
+                    last_name=row['last_name'], email=row['email'], \
+                    cell_phone=row.get('cell_phone') or None, location_id=location_id, \
+                    email_notifications=parse_bool(row.get('email_notifications', True)), \
+                    sms_notifications=parse_bool(row.get('sms_notifications', False))))
+        bulk_insert(User, users)
+        self.counts['user'] = len(users)
+
+    def load_items(self):
+        rows = self.rows['item']
+        if not rows:
+            return
+        sellers = self.lookup(User, 'username', [row['seller'] for where, row in rows])
+        categories = self.lookup(Category, 'name', [row['category'] for where, row in rows])
+        now = datetime.utcnow()
+        last = Item.objects.order_by('-id').values_list('id', flat=True)[:1]
+        last_id = last[0] if last else 0
+
+        items = []
+        for where, row in rows:
+            upload_time = now
+            if row.get('upload_time'):
+                upload_time = parse_time(row['upload_time'])
+            items.append(Item( \
+                    seller_user_id=self.resolve(sellers, row['seller'], 'seller', where), \
+                    name=row['name'], description=row.get('description', ''), \
+                    category_id=self.resolve(categories, row['category'], 'category', where), \
+                    price=parse_decimal(row['price'], 'price', where), \
+                    upload_time=upload_time, claimed=False, image=row.get('image') or None))
+        bulk_insert(Item, items)
+        self.counts['item'] = len(items)
+
+        for batch in in_id_batches(Item.objects.filter(id__gt=last_id)):
+            ItemKeyword.index_items(batch)
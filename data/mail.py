@@ -0,0 +1,132 @@
+import smtplib
+import threading
+import time
+
+from site_specific_constants import SMTP_HOST, SMTP_PORT
+from data.metrics import registry
+
+# served by /metrics; emails are timed here so that the outbox workers'
+# batches are counted as well as User.send_email
+notification_seconds = registry.histogram('geddit_notification_send_seconds', \
+        'Time taken to send one email or SMS.', labels=('channel',))
+notification_failures = registry.counter('geddit_notification_failures_total', \
+        'Emails and SMS that could not be sent.', labels=('channel',))
+
+class SMTPTransport(object):
+    '''
+    sends mail over a pool of long-lived SMTP sessions.
+
+    A session is reused for up to max_messages messages, and dropped once it
+    has been idle for idle_timeout seconds (most servers hang up on idle
+    clients anyway). send_many pipelines a whole batch over one session.
+    '''
+    def __init__(self, host, port, pool_size=4, max_messages=100, idle_timeout=30, \
+            connection_class=smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.connection_class = connection_class
+        self.lock = threading.Lock()
+        # idle sessions as [connection, messages sent, last used]
+        self.idle = []
+        self.connections_opened = 0
+
+    def _connect(self):
+        connection = self.connection_class(self.host, self.port)
+        with self.lock:
+            self.connections_opened += 1
+        return [connection, 0, time.time()]
+
+    def _acquire(self):
+        with self.lock:
+            while self.idle:
+                session = self.idle.pop()
+                if time.time() - session[2] < self.idle_timeout:
+                    return session
+                self._quit(session)
+        return self._connect()
+
+    def _release(self, session):
+        session[2] = time.time()
+        with self.lock:
+            if session[1] < self.max_messages and len(self.idle) < self.pool_size:
+                self.idle.append(session)
+                return
+        self._quit(session)
+
+    def _quit(self, session):
+        try:
+            session[0].quit()
+        except (smtplib.SMTPException, IOError):
+            pass
+
+    def send_many(self, messages):
+        '''
+        sends each email.message.Message to its To header, and returns a list
+        with None for each message sent and the exception for each failure
+        '''
+        errors = []
+        session = self._acquire()
+        try:
+            for message in messages:
+                start = time.time()
+                try:
+                    if session is None:
+                        session = self._connect()
+                    error = self._send(session, message)
+                except (smtplib.SMTPException, IOError), e:
+                    # reconnecting failed; the messages already sent stay sent
+                    session = None
+                    error = e
+                notification_seconds.observe(time.time() - start, channel='email')
+                if error is not None:
+                    notification_failures.inc(channel='email')
+                errors.append(error)
+                if session is not None:
+                    session[1] += 1
+                    if session[1] >= self.max_messages:
+                        # the next message, if any, opens a new session
+                        self._quit(session)
+                        session = None
+        finally:
+            if session is not None:
+                self._release(session)
+        return errors
+
+    def _send(self, session, message):
+        for retry in (False, True):
+            try:
+                session[0].sendmail(message['From'], [message['To']], message.as_string())
+                return None
+            except smtplib.SMTPServerDisconnected, e:
+                # the server dropped the pooled session, reconnect once;
+                # send_many catches a failure to reconnect
+                if retry:
+                    return e
+                session[:] = self._connect()
+            except (smtplib.SMTPException, IOError), e:
+                return e
+
+    def send(self, message):
+        error = self.send_many([message])[0]
+        if error is not None:
+            raise error
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for session in idle:
+            self._quit(session)
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_mail_transport():
+    ''' returns the process-wide SMTP transport '''
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = SMTPTransport(SMTP_HOST, SMTP_PORT)
+        return _transport
@@ -0,0 +1,69 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+from data.benchmark import Benchmark, compare
+
+class Command(NoArgsCommand):
+    help = 'Times the buy, sell, dashboard and claim paths against synthetic data ' \
+            'in a throwaway test database.'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--users', type='int', dest='users', default=200),
+        make_option('--locations', type='int', dest='locations', default=20),
+        make_option('--categories', type='int', dest='categories', default=20),
+        make_option('--items', type='int', dest='items', default=5000),
+        make_option('--reservations', type='int', dest='reservations', default=1000),
+        make_option('--claims', type='int', dest='claims', default=500),
+        make_option('--iterations', type='int', dest='iterations', default=50,
+            help='Times each operation is run.'),
+        make_option('--seed', type='int', dest='seed', default=0),
+        make_option('--output', dest='output', default=None,
+            help='Write the results to this JSON file.'),
+        make_option('--baseline', dest='baseline', default=None,
+            help='Compare against the JSON results of an earlier run.'),
+        make_option('--threshold', type='float', dest='threshold', default=0.2,
+            help='Relative growth reported as a regression (default 0.2).'),
+        make_option('--noinput', action='store_false', dest='interactive', default=True,
+            help='Replace an existing test database without asking.'),
+    )
+
+    def handle_noargs(self, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+        if options['users'] < 2 or options['items'] < 1:
+            raise CommandError('The benchmark needs at least 2 users and 1 item.')
+
+        benchmark = Benchmark(options['users'], options['locations'], \
+                options['categories'], options['items'], options['reservations'], \
+                options['claims'], options['iterations'], options['seed'])
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, \
+                autoclobber=not options['interactive'])
+        try:
+            results = benchmark.run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write('%-20s %9s %9s %9s %9s %9s\n' % \
+                ('operation', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'max q'))
+        for name, result in sorted(results['results'].items()):
+            self.stdout.write('%-20s %9.2f %9.2f %9.2f %9.1f %9d\n' % (name, \
+                    result['p50_ms'], result['p95_ms'], result['p99_ms'], \
+                    result['queries_mean'], result['queries_max']))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['threshold'])
+            for name, metric, before, after, change in regressions:
+                self.stdout.write('REGRESSION %s %s: %.2f -> %.2f (%+.0f%%)\n' % \
+                        (name, metric, before, after, 100 * change))
+            if not regressions:
+                self.stdout.write('No regressions against %s\n' % options['baseline'])
@@ -0,0 +1,38 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from data.export import export, export_filters, ExportError, EXPORTS, WRITERS
+
+class Command(BaseCommand):
+    args = '<%s>' % '|'.join(sorted(EXPORTS))
+    help = 'Streams items, claims or reservations as CSV or NDJSON.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='csv',
+            help='%s (default csv).' % ' or '.join(sorted(WRITERS))),
+        make_option('--start', dest='start', default=None,
+            help='Only rows from this date on (YYYY-MM-DD).'),
+        make_option('--end', dest='end', default=None,
+            help='Only rows before this date (YYYY-MM-DD).'),
+        make_option('--category', dest='category', default=None,
+            help='Only rows in the category with this name.'),
+        make_option('--output', dest='output', default=None,
+            help='File to write to instead of standard output.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Name one export: %s' % ', '.join(sorted(EXPORTS)))
+        try:
+            chunks = export(args[0], options['format'], **export_filters(options))
+        except ExportError, e:
+            raise CommandError(str(e))
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,73 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from data.models import Item
+
+class Command(NoArgsCommand):
+    help = 'Writes the thumbnail and medium copies of uploaded item images.'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--all', action='store_true', dest='all', default=False,
+            help='Check every item with an image and backfill missing copies.'),
+        make_option('--force', action='store_true', dest='force', default=False,
+            help='With --all, rewrite the copies under new names even if they exist.'),
+        make_option('--loop', action='store_true', dest='loop', default=False,
+            help='Keep processing new uploads instead of exiting.'),
+        make_option('--interval', type='float', dest='interval', default=5.0,
+            help='Seconds between polls when there is nothing to do.'),
+        make_option('--batch-size', type='int', dest='batch_size', default=100,
+            help='Items loaded per query.'),
+    )
+
+    def handle_noargs(self, **options):
+        if options['all']:
+            self.backfill(options['batch_size'], options['force'])
+            return
+        while True:
+            done = self.process_new(options['batch_size'])
+            if not options['loop']:
+                break
+            if not done:
+                time.sleep(options['interval'])
+
+    def process_new(self, batch_size):
+        ''' processes the items uploaded since the last run, returns how many '''
+        done = 0
+        last_id = 0
+        while True:
+            items = list(Item.get_items_without_thumbnails(batch_size, last_id))
+            if not items:
+                return done
+            batch = []
+            try:
+                for item in items:
+                    self.make_thumbnails(item, False, batch)
+                    last_id = item.id
+                    done += 1
+            finally:
+                # one catalog bump per batch rather than per item
+                Item.thumbnails_changed(batch)
+
+    def backfill(self, batch_size, force):
+        last_id = 0
+        while True:
+            items = list(Item.objects.exclude(image='').exclude(image=None) \
+                    .filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not items:
+                return
+            batch = []
+            try:
+                for item in items:
+                    self.make_thumbnails(item, force, batch)
+                    last_id = item.id
+            finally:
+                Item.thumbnails_changed(batch)
+
+    def make_thumbnails(self, item, force, batch):
+        try:
+            Item.make_thumbnails(item, force, batch)
+        except (IOError, OSError), e:
+            # a new upload through the admin clears this
+            Item.mark_thumbnails_failed(item)
+            self.stderr.write('Could not resize the image of item %d: %s\n' % (item.id, e))
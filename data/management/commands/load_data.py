@@ -0,0 +1,29 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from data.loader import BulkLoader, LoadError, MODELS
+
+class Command(BaseCommand):
+    args = '<file file ...>'
+    help = 'Bulk loads locations, categories, users and items from JSONL or CSV files.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--model', dest='model', default=None,
+            help='What the files hold (%s), if not named in the rows or by the file name.' % \
+                    ', '.join(MODELS)),
+    )
+
+    def handle(self, *paths, **options):
+        if not paths:
+            raise CommandError('Give at least one file to load.')
+        start = time.time()
+        loader = BulkLoader()
+        try:
+            for path in paths:
+                loader.read(path, options['model'])
+            counts = loader.load()
+        except (LoadError, IOError, KeyError), e:
+            raise CommandError('Nothing was loaded: %s' % e)
+        self.stdout.write('Loaded %s in %.2fs\n' % (', '.join('%d %s rows' % \
+                (counts[model], model) for model in MODELS), time.time() - start))
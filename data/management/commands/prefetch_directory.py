@@ -0,0 +1,32 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from mit.directory import get_directory
+
+class Command(BaseCommand):
+    args = '<username username ...>'
+    help = 'Looks usernames up in the MIT directory ahead of their first login. ' + \
+            'Only helps the site if the cache is shared, such as memcached.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--file', dest='file', default=None,
+            help='File with one username (or email address) per line.'),
+    )
+
+    def handle(self, *args, **options):
+        usernames = list(args)
+        if options['file']:
+            try:
+                with open(options['file']) as f:
+                    usernames.extend(line.strip() for line in f if line.strip())
+            except IOError, e:
+                raise CommandError(str(e))
+        if not usernames:
+            raise CommandError('Name some usernames or a --file of them.')
+        usernames = set(username.split('@')[0].lower().decode('utf-8') \
+                for username in usernames)
+
+        entries = get_directory().lookup_many(usernames)
+        self.stdout.write('Found %d of %d usernames\n' % (len(entries), len(usernames)))
+        for username in sorted(usernames - set(entries)):
+            self.stdout.write('Not in the directory: %s\n' % username)
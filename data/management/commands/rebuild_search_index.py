@@ -0,0 +1,12 @@
+from django.core.management.base import NoArgsCommand
+from data.models import ItemKeyword, ReservationKeyword
+
+class Command(NoArgsCommand):
+    help = 'Rebuilds the keyword indexes used by search and reservation matching.'
+
+    def handle_noargs(self, **options):
+        ItemKeyword.rebuild_index()
+        self.stdout.write('Indexed %d item keywords\n' % ItemKeyword.objects.count())
+        ReservationKeyword.rebuild_index()
+        self.stdout.write('Indexed %d reservation keywords\n' % \
+                ReservationKeyword.objects.count())
@@ -0,0 +1,46 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from data.notifications import NotificationWorkerPool, LiveSender, FakeSink
+
+class Command(NoArgsCommand):
+    help = 'Delivers the queued email and SMS notifications.'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--workers', type='int', dest='workers', default=4,
+            help='Number of batches sent concurrently.'),
+        make_option('--batch-size', type='int', dest='batch_size', default=20,
+            help='Notifications handed to a worker at once; emails in a batch share an SMTP session.'),
+        make_option('--max-attempts', type='int', dest='max_attempts', default=5,
+            help='Attempts before a notification is marked as failed.'),
+        make_option('--backoff', type='int', dest='backoff', default=30,
+            help='Seconds before the first retry, doubled on every retry.'),
+        make_option('--loop', action='store_true', dest='loop', default=False,
+            help='Keep polling for new notifications instead of exiting.'),
+        make_option('--interval', type='float', dest='interval', default=1.0,
+            help='Seconds between polls when there is nothing to send.'),
+        make_option('--fake', action='store_true', dest='fake', default=False,
+            help='Deliver to an in-memory sink instead of SMTP/SMS.'),
+        make_option('--fake-latency', type='float', dest='fake_latency', default=0.0,
+            help='Seconds the fake sink takes per message.'),
+    )
+
+    def handle_noargs(self, **options):
+        if options['fake']:
+            sender = FakeSink(options['fake_latency'])
+        else:
+            sender = LiveSender()
+        pool = NotificationWorkerPool(sender, options['workers'], \
+                options['max_attempts'], options['backoff'], options['batch_size'])
+
+        if options['loop']:
+            pool.run_forever(options['interval'])
+            return
+
+        start = time.time()
+        handled = pool.drain()
+        elapsed = time.time() - start
+        rate = handled / elapsed if elapsed > 0 else 0.0
+        self.stdout.write('Sent %d, failed %d in %.2fs (%.1f/s)\n' % \
+                (pool.sent, pool.failed, elapsed, rate))
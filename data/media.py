@@ -0,0 +1,134 @@
+import mimetypes
+import os
+import posixpath
+import re
+import urllib
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def resolve_path(document_root, path):
+    ''' maps a url path to a file under document_root, refusing anything outside it '''
+    path = posixpath.normpath(urllib.unquote(path)).lstrip('/')
+    parts = [part for part in path.split('/') if part not in ('', '.')]
+    if '..' in parts or any(os.path.dirname(part) for part in parts):
+        raise Http404('"%s" is not a media file' % path)
+    return os.path.join(document_root, *parts), '/'.join(parts)
+
+def make_etag(stat):
+    return '"%x-%x-%x"' % (stat.st_ino, stat.st_size, int(stat.st_mtime))
+
+def etag_matches(etag, if_none_match):
+    ''' whether an If-None-Match header names etag (or is *) '''
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags
+
+def parse_range(header, size):
+    '''
+    returns the (first, last) byte positions asked for by a single-range
+    Range header, None to send the whole file, or False if the range can't
+    be satisfied
+    '''
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        # several ranges, or something we don't understand: send everything
+        return None
+    first, last = match.groups()
+    if first == '' and last == '':
+        return None
+    if first == '':
+        # the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = size - 1 if last == '' else min(int(last), size - 1)
+    if first >= size or first > last:
+        return False
+    return first, last
+
+def read_chunks(path, first, length):
+    with open(path, 'rb') as f:
+        f.seek(first)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+def serve_media(request, path, document_root=None):
+    '''
+    serves an uploaded file with validators and long-lived caching headers.
+
+    With MEDIA_SERVE_MODE set to 'x-sendfile' or 'x-accel-redirect' the
+    front-end server sends the bytes; otherwise the file is streamed in
+    chunks, which is only meant for the development server.
+    '''
+    if document_root is None:
+        document_root = settings.MEDIA_ROOT
+    full_path, path = resolve_path(document_root, path)
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404('"%s" does not exist' % path)
+    if not os.path.isfile(full_path):
+        raise Http404('"%s" is not a file' % path)
+
+    etag = make_etag(stat)
+    last_modified = int(stat.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': 'public, max-age=%d' % getattr(settings, 'MEDIA_CACHE_MAX_AGE', 0),
+        'Accept-Ranges': 'bytes',
+    }
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', None)
+    if_modified_since = parse_http_date_safe( \
+            request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if (if_none_match is not None and etag_matches(etag, if_none_match)) or \
+            (if_none_match is None and if_modified_since is not None and \
+                last_modified <= if_modified_since):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'stream')
+    if mode in ('x-sendfile', 'x-accel-redirect'):
+        # the front-end server handles ranges itself
+        response = HttpResponse('', content_type=content_type)
+        if mode == 'x-sendfile':
+            response['X-Sendfile'] = full_path
+        else:
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+    else:
+        byte_range = None
+        if 'HTTP_RANGE' in request.META and \
+                request.META.get('HTTP_IF_RANGE', etag) == etag:
+            byte_range = parse_range(request.META['HTTP_RANGE'], stat.st_size)
+        if byte_range is False:
+            response = HttpResponse('', status=416, content_type=content_type)
+            response['Content-Range'] = 'bytes */%d' % stat.st_size
+        elif byte_range is None:
+            response = HttpResponse(read_chunks(full_path, 0, stat.st_size), \
+                    content_type=content_type)
+            response['Content-Length'] = str(stat.st_size)
+        else:
+            first, last = byte_range
+            response = HttpResponse(read_chunks(full_path, first, last - first + 1), \
+                    status=206, content_type=content_type)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (first, last, stat.st_size)
+            response['Content-Length'] = str(last - first + 1)
+
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,213 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# seconds, for anything that talks to another service
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+def format_labels(names, values, extra=()):
+    pairs = zip(names, values) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, unicode(value).replace('\\', '\\\\') \
+            .replace('"', '\\"').replace('\n', '\\n')) for name, value in pairs)
+
+class Metric(object):
+    '''
+    a named value per combination of label values. Every update takes the
+    metric's lock, so request threads and workers can share it.
+    '''
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError('%s takes the labels %s' % (self.name, ', '.join(self.labels)))
+        return tuple(unicode(labels[name]) for name in self.labels)
+
+    def samples(self):
+        ''' [(suffix, label values, extra labels, value)] '''
+        with self.lock:
+            return [('', key, (), value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.kind)]
+        for suffix, key, extra, value in self.samples():
+            lines.append('%s%s%s %s' % (self.name, suffix, \
+                    format_labels(self.labels, key, extra), format_value(value)))
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+class Gauge(Metric):
+    '''
+    a value that goes up and down. set_function makes the value whatever
+    the function returns when the metrics are read.
+    '''
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        super(Gauge, self).__init__(name, help, labels)
+        self.functions = {}
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.functions[key] = function
+
+    def get(self, **labels):
+        key = self.key(labels)
+        with self.lock:
+            function = self.functions.get(key, None)
+            value = self.values.get(key, 0)
+        return value if function is None else function()
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+            functions = dict(self.functions)
+        for key, function in functions.items():
+            values[key] = function()
+        return [('', key, (), value) for key, value in sorted(values.items())]
+
+class Histogram(Metric):
+    ''' counts of observations at or below each of a fixed set of bounds '''
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            counts = self.values[key]
+            counts[0][index] += 1
+            counts[1] += 1
+            counts[2] += value
+
+    def get(self, **labels):
+        ''' (count, sum) '''
+        with self.lock:
+            counts = self.values.get(self.key(labels), None)
+            return (0, 0.0) if counts is None else (counts[1], counts[2])
+
+    def samples(self):
+        with self.lock:
+            values = [(key, (list(counts[0]), counts[1], counts[2])) \
+                    for key, counts in sorted(self.values.items())]
+        samples = []
+        for key, (buckets, count, total) in values:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), buckets):
+                cumulative += bucket
+                samples.append(('_bucket', key, [('le', format_value(float(bound)))], \
+                        cumulative))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), count))
+        return samples
+
+class Registry(object):
+    ''' the metrics of this process, rendered in the Prometheus text format '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric_class, name, help, **kwargs):
+        # modules may be imported more than once, so registering is idempotent
+        with self.lock:
+            metric = self.metrics.get(name, None)
+            if metric is None:
+                metric = self.metrics[name] = metric_class(name, help, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError('%s is already a %s' % (name, metric.kind))
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter, name, help, labels=labels)
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge, name, help, labels=labels)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram, name, help, labels=labels, buckets=buckets)
+
+    def render(self):
+        with self.lock:
+            metrics = sorted(self.metrics.items())
+        return ''.join(metric.render() + '\n' for name, metric in metrics)
+
+registry = Registry()
+
+class timed(object):
+    ''' with timed(histogram, **labels): observes how long the block took, even if it raises '''
+    def __init__(self, histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.histogram.observe(time.time() - self.start, **self.labels)
+        return False
+
+def hit_ratio(stats):
+    ''' a function giving the share of lookups that were hits, for a get_stats method '''
+    def ratio():
+        counts = stats()
+        lookups = counts['hits'] + counts['misses']
+        return float(counts['hits']) / lookups if lookups else 0.0
+    return ratio
+
+def serve_metrics(request):
+    ''' the metrics of this process, for the scraper on METRICS_ALLOWED_IPS '''
+    if request.META.get('REMOTE_ADDR', None) not in \
+            getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1',)):
+        return HttpResponseForbidden('Forbidden')
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
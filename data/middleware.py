@@ -0,0 +1,56 @@
+import random
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.functional import SimpleLazyObject
+from site_specific_functions import get_current_user
+
+from data import profiling
+
+class CurrentUserMiddleware(object):
+    '''
+    attaches the current user to the request as request.current_user. The
+    lookup only happens the first time the attribute is used, and is shared
+    with get_current_user.
+    '''
+    def process_request(self, request):
+        request.current_user = SimpleLazyObject(lambda: get_current_user(request))
+
+class ProfilingMiddleware(object):
+    '''
+    records the queries, SQL time, template time and view time of a sample
+    of requests, sends them back in a Server-Timing header and logs them as
+    a JSON line to the data.profiling logger.
+
+    PROFILING_SAMPLE_RATE is the fraction of requests profiled. At 0 (the
+    default) the middleware takes itself out of the request cycle, so it
+    costs nothing. It should come first in MIDDLEWARE_CLASSES, so that the
+    total covers the other middleware too.
+    '''
+    def __init__(self):
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.slow_queries = getattr(settings, 'PROFILING_SLOW_QUERIES', 3)
+        profiling.install_template_timer()
+
+    def process_request(self, request):
+        profiling.current.profile = None
+        if random.random() < self.sample_rate:
+            profiling.current.profile = profiling.RequestProfile(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(profiling.current, 'profile', None)
+        if profile is not None:
+            profile.start_view(view_func)
+
+    def process_response(self, request, response):
+        profile = getattr(profiling.current, 'profile', None)
+        if profile is None:
+            return response
+        profiling.current.profile = None
+        profile.finish()
+        # only headers are added, so streamed responses stay streamed
+        response['Server-Timing'] = profile.server_timing()
+        profile.log(self.slow_queries)
+        return response
@@ -1,11 +1,38 @@
-from django.db import models
-import smtplib
+from django.db import connection, models, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
 from email.mime.text import MIMEText
-from googlevoice import Voice
-from datetime import datetime
-from site_specific_constants import SITE_ROOT, GEDDIT_GMAIL, GEDDIT_PASSWORD
+from datetime import datetime, timedelta
+from site_specific_constants import SITE_ROOT, GEDDIT_GMAIL
+from data.search import tokenize, KEYWORD_MAX_LENGTH
+from data.mail import get_mail_transport, notification_seconds, notification_failures
+from data.sms import get_sms_gateway
+from data.cache import CacheVersion, VersionedCache
+from data.typeahead import Typeahead
+from data.metrics import registry, hit_ratio, timed
+from data import geo, thumbnails
 import json
 
+# rows per INSERT for bulk loads; SQLite also caps the number of parameters
+BULK_BATCH_SIZE = 500
+SQLITE_MAX_PARAMETERS = 999
+
+def bulk_insert(model, objects):
+    ''' bulk_create in batches small enough for every database we run on '''
+    batch_size = min(BULK_BATCH_SIZE, SQLITE_MAX_PARAMETERS / len(model._meta.local_fields))
+    for i in range(0, len(objects), batch_size):
+        model.objects.bulk_create(objects[i:i + batch_size])
+
+def in_id_batches(queryset, batch_size=BULK_BATCH_SIZE):
+    ''' yields the rows of queryset as lists, walking the ids instead of using OFFSET '''
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
 USERNAME_MAX_LENGTH = 25
 PERSON_NAME_MAX_LENGTH = 25
 PHONE_NUMBER_MAX_LENGTH = 20
@@ -21,6 +48,12 @@ class Location(models.Model):
     latitude = models.DecimalField(verbose_name="Latitude",
                                    max_digits=20,
                                    decimal_places=17)
+    # float copies of the coordinates and the grid cell they fall in,
+    # kept up to date by save() for proximity searches
+    lat_float = models.FloatField(default=0.0, editable=False)
+    lng_float = models.FloatField(default=0.0, editable=False)
+    grid_row = models.IntegerField(default=0, editable=False, db_index=True)
+    grid_col = models.IntegerField(default=0, editable=False, db_index=True)
     
     def __unicode__(self):
         return unicode(self.name)
@@ -28,6 +61,19 @@ class Location(models.Model):
     class Meta:
         verbose_name = 'Location'
         verbose_name_plural = 'Locations'
+
+    def save(self, *args, **kwargs):
+        self.update_coordinates()
+        super(Location, self).save(*args, **kwargs)
+
+    def update_coordinates(self):
+        ''' recomputes the float coordinates and grid cell; bulk inserts must call this '''
+        self.lat_float = float(self.latitude)
+        self.lng_float = float(self.longitude)
+        self.grid_row, self.grid_col = geo.grid_cell(self.lat_float, self.lng_float)
+
+    def distance_to(self, other):
+        return geo.distance(self.lat_float, self.lng_float, other.lat_float, other.lng_float)
     
     @staticmethod
     def create_location(locationName, lat, lng):
@@ -40,6 +86,33 @@ class Location(models.Model):
     @staticmethod
     def get_location(name):
         return Location.objects.get(name=name)
+
+    @staticmethod
+    def get_all_locations():
+        return Location.objects.all().order_by('name')
+
+    @staticmethod
+    def get_cached_locations():
+        return location_cache.get()
+
+    @staticmethod
+    def get_locations_near(location, radius):
+        '''
+        returns [(distance, location)] for the locations within radius meters
+        of location, closest first. Only the grid cells that can hold such a
+        location are searched.
+        '''
+        rows, cols = geo.grid_span(location.lat_float, radius)
+        candidates = Location.objects.filter( \
+                grid_row__range=(location.grid_row - rows, location.grid_row + rows), \
+                grid_col__range=(location.grid_col - cols, location.grid_col + cols))
+        nearby = []
+        for candidate in candidates:
+            d = location.distance_to(candidate)
+            if d <= radius:
+                nearby.append((d, candidate))
+        nearby.sort(key=lambda pair: pair[0])
+        return nearby
     
 class User(models.Model):
     # The id field is automatically generated by Django
@@ -72,49 +145,64 @@ class User(models.Model):
 
     @staticmethod
     def get_user(username):
-        return User.objects.get(username=username)
+        return User.objects.select_related('location').get(username=username)
 
     @staticmethod
     def delete_user(user):
         user.delete()
     
-    def send_email(self, message, subject):
+    def make_email(self, message, subject):
         msg = MIMEText(message)
         msg['Subject'] = subject
         msg['From'] = GEDDIT_GMAIL
         msg['To'] = self.email
+        return msg
 
-        s = smtplib.SMTP('localhost')
-        s.sendmail(GEDDIT_GMAIL, [self.email], msg.as_string())
-        s.quit()
+    def send_email(self, message, subject):
+        # timed and counted by the transport
+        get_mail_transport().send(self.make_email(message, subject))
 
     def send_sms(self, message):
-        voice = Voice()
-        voice.login(GEDDIT_GMAIL, GEDDIT_PASSWORD)
-        voice.send_sms(self.cell_phone, message)
+        with timed(notification_seconds, channel=Notification.SMS):
+            try:
+                get_sms_gateway().send(self.cell_phone, message)
+            except Exception:
+                notification_failures.inc(channel=Notification.SMS)
+                raise
 
     def add_item(self, name, description, category, price, image=None):
-        item = Item.create_item(self, name, description, category, price, image=image)
-
-        # find reservations that match the item
-        reservations = Reservation.get_matching_reservations(item)
-
-        # figure out the users to be emailed and SMS-ed
-        users = {}
-        for reservation in reservations:
-            if reservation.user.id in users:
-                continue
-            users[reservation.user.id] = reservation.user
-        # email and SMS
-        for uid in users:
-            if users[uid].email_notifications:
-                users[uid].send_email('An item has been posted that matches your reservation.\n' + \
-                        'Check it out at ' + SITE_ROOT + 'buy?id=' + str(item.id), \
-                        '[Geddit] matching reservation')
-            if users[uid].sms_notifications:
-                users[uid].send_sms('[Geddit] An item has been posted that matches your reservation.\n' + \
-                        'Check it out at ' + SITE_ROOT + 'buy?id=' + str(item.id))
+        # the item and its notifications are committed together; the
+        # send_notifications workers deliver them outside of the request
+        with transaction.commit_on_success():
+            item = Item.create_item(self, name, description, category, price, image=image)
+
+            # find reservations that match the item
+            reservations = Reservation.get_matching_reservations(item)
+            reservation_matches.observe(len(reservations))
 
+            # figure out the users to be emailed and SMS-ed
+            users = {}
+            for reservation in reservations:
+                if reservation.user.id in users:
+                    continue
+                users[reservation.user.id] = reservation.user
+            # queue the emails and SMS
+            notifications = []
+            for uid in users:
+                if users[uid].email_notifications:
+                    notifications.append(Notification.new_email(users[uid], \
+                            'An item has been posted that matches your reservation.\n' + \
+                            'Check it out at ' + SITE_ROOT + 'buy?id=' + str(item.id), \
+                            '[Geddit] matching reservation'))
+                if users[uid].sms_notifications:
+                    notifications.append(Notification.new_sms(users[uid], \
+                            '[Geddit] An item has been posted that matches your reservation.\n' + \
+                            'Check it out at ' + SITE_ROOT + 'buy?id=' + str(item.id)))
+            Notification.queue_notifications(notifications)
+
+        # create_item bumped inside the transaction; bump again now that the
+        # item is visible to other requests
+        catalog_changed()
         return item
 
     def get_items(self):
@@ -131,7 +219,7 @@ class User(models.Model):
 
     def remove_claim(self, item):
         claim = Claim.get_claim(item)
-        if claim.buyer != self:
+        if claim.buyer_id != self.id:
             raise AssertionError('Claim does not belong to you')
         Claim.delete_claim(claim)
 
@@ -179,8 +267,57 @@ class Category(models.Model):
     def get_all_categories():
         return Category.objects.all().order_by('name')
 
+    @staticmethod
+    def get_cached_categories():
+        ''' same as get_all_categories, from the process-local category cache '''
+        return category_cache.get()
+
+category_cache = VersionedCache('categories', \
+        lambda: list(Category.get_all_categories()))
+
+def invalidate_category_cache(sender, **kwargs):
+    category_cache.bump()
+
+# covers create_category, delete_category and edits through the admin
+post_save.connect(invalidate_category_cache, sender=Category)
+post_delete.connect(invalidate_category_cache, sender=Category)
+
+location_cache = VersionedCache('locations', \
+        lambda: list(Location.get_all_locations()))
+
+def invalidate_location_cache(sender, **kwargs):
+    location_cache.bump()
+
+post_save.connect(invalidate_location_cache, sender=Location)
+post_delete.connect(invalidate_location_cache, sender=Location)
+
+# bumped whenever the set of listings shown on the buy page changes. Bumps
+# come after the change is committed, so nothing rendered before it can be
+# cached under the new version.
+catalog_version = CacheVersion('catalog')
+
+# search bar suggestions from the names of unclaimed items and categories
+suggestions = Typeahead(catalog_version, \
+        lambda: Item.objects.filter(claimed=False).values_list('name', flat=True).iterator(), \
+        lambda: Category.get_cached_categories())
+
+def catalog_changed(added=(), removed=()):
+    ''' bumps catalog_version, telling this process's suggestions which item names came and went '''
+    suggestions.changed(catalog_version.bump(), added, removed)
+
+# served by /metrics
+reservation_matches = registry.histogram('geddit_reservation_matches', \
+        'Reservations matched by each new item.', buckets=(0, 1, 2, 5, 10, 25, 50, 100))
+claims = registry.counter('geddit_claims_total', \
+        'Claim attempts, by whether the item was still available.', labels=('outcome',))
+cache_hit_ratio = registry.gauge('geddit_cache_hit_ratio', \
+        'Share of lookups answered by a cache in this process.', labels=('cache',))
+cache_hit_ratio.set_function(hit_ratio(category_cache.get_stats), cache='categories')
+cache_hit_ratio.set_function(hit_ratio(location_cache.get_stats), cache='locations')
+
 ITEM_NAME_MAX_LENGTH = 100
 DESCRIPTION_NAME_MAX_LENGTH = 1000
+ITEMS_PER_PAGE = 50
 
 class Item(models.Model):
     # Django will automatically generate this:
@@ -193,10 +330,39 @@ class Item(models.Model):
     upload_time = models.DateTimeField(default=datetime.utcnow)
     price = models.DecimalField(max_digits=8, decimal_places=2)
     image = models.ImageField(upload_to="images/%Y/%m/%d/", blank=True, null=True)
+    # set once generate_thumbnails has written the resized copies of image
+    thumbnails_ready = models.BooleanField(default=False, editable=False, db_index=True)
+    # bumped whenever the copies are rewritten, to give them new names
+    thumbnails_version = models.PositiveIntegerField(default=0, editable=False)
+    # set if the image couldn't be read, so that it isn't retried
+    thumbnails_failed = models.BooleanField(default=False, editable=False)
 
     def __unicode__(self):
         return self.name
 
+    def get_image_url(self, variant):
+        ''' the url of a resized copy of the image, or of the original until it exists '''
+        return Item.image_url(self.image.name, self.thumbnails_ready, \
+                self.thumbnails_version, variant)
+
+    @staticmethod
+    def image_url(image_name, thumbnails_ready, thumbnails_version, variant):
+        ''' get_image_url for the image columns of a row fetched without its Item '''
+        if not image_name:
+            return None
+        storage = Item._meta.get_field('image').storage
+        if not thumbnails_ready:
+            return storage.url(image_name)
+        return storage.url(thumbnails.variant_name(image_name, variant, thumbnails_version))
+
+    @property
+    def thumbnail_url(self):
+        return self.get_image_url('thumb')
+
+    @property
+    def medium_url(self):
+        return self.get_image_url('medium')
+
     class Meta:
         verbose_name = 'Item'
         verbose_name_plural = 'Items'
@@ -206,43 +372,233 @@ class Item(models.Model):
         i = Item(seller_user=seller_user, name=name, description=description, \
                 claimed=False, category=category, price=price, image=image)
         i.save()
+        ItemKeyword.index_item(i)
+        catalog_changed(added=[i.name])
         return i
 
     @staticmethod
     def get_item_by_id(id):
         return Item.objects.get(id=id)
 
+    @staticmethod
+    def get_item_with_seller(id):
+        return Item.objects.select_related('seller_user').get(id=id)
+
     @staticmethod
     def get_items(seller_user):
-        return Item.objects.filter(seller_user=seller_user)
+        return Item.objects.filter(seller_user=seller_user) \
+                .select_related('seller_user__location')
 
     # deprecated
     @staticmethod
     def get_all_items():
         return Item.objects.all().filter(claimed=False).order_by('-upload_time')
 
+    # the orders the buy page can list items in: (field, descending)
+    NEWEST = 'newest'
+    PRICE_LOW = 'price_low'
+    PRICE_HIGH = 'price_high'
+    SORT_ORDERS = {
+        NEWEST: ('upload_time', True),
+        PRICE_LOW: ('price', False),
+        PRICE_HIGH: ('price', True),
+    }
+
     @staticmethod
-    def get_filtered_items(category=None, search_query=None, id=None):
+    def get_filtered_items(category=None, search_query=None, id=None, after=None, \
+            min_price=None, max_price=None, sort=NEWEST):
+        '''
+        returns the unclaimed items matching the filters, in the sort order
+        (newest first by default) with ties broken by id. after is a
+        (value, id) cursor, where value is the sort field of the last item
+        seen; only items listed after it are returned.
+        '''
         items = Item.objects.all().filter(claimed=False)
         if category is not None:
             items = items.filter(category=category)
-        if search_query is not None:
-            for keyword in search_query.split():
-                items = items.filter(name__icontains=keyword)
+        if min_price is not None:
+            items = items.filter(price__gte=min_price)
+        if max_price is not None:
+            items = items.filter(price__lte=max_price)
+        if search_query is not None and search_query.strip():
+            keywords = tokenize(search_query)
+            if not keywords:
+                # a query of only punctuation matches nothing rather than everything
+                items = items.none()
+            # each keyword narrows the set of ids from the keyword index
+            for keyword in keywords:
+                items = items.filter(id__in=ItemKeyword.get_item_ids(keyword))
         if id is not None:
             items = items.filter(id=id)
-        return items.order_by('-upload_time')
+        field, descending = Item.SORT_ORDERS[sort]
+        if after is not None:
+            value, after_id = after
+            if descending:
+                items = items.filter(Q(**{field + '__lt': value}) | \
+                        Q(**{field: value, 'id__lt': after_id}))
+            else:
+                items = items.filter(Q(**{field + '__gt': value}) | \
+                        Q(**{field: value, 'id__gt': after_id}))
+        # the listings table shows the seller's location on every row
+        items = items.select_related('seller_user__location')
+        if descending:
+            return items.order_by('-' + field, '-id')
+        return items.order_by(field, 'id')
+
+    @staticmethod
+    def get_item_page(category=None, search_query=None, id=None, after=None, \
+            page_size=ITEMS_PER_PAGE, min_price=None, max_price=None, sort=NEWEST):
+        ''' returns a page of filtered items and the cursor of the next page, or None '''
+        items = list(Item.get_filtered_items(category, search_query, id, after, \
+                min_price, max_price, sort)[:page_size + 1])
+        if len(items) <= page_size:
+            return items, None
+        items = items[:page_size]
+        field, descending = Item.SORT_ORDERS[sort]
+        return items, (getattr(items[-1], field), items[-1].id)
+
+    @staticmethod
+    def suggest(prefix, limit=10):
+        ''' [(kind, name)] of categories and unclaimed items with a word starting with prefix '''
+        return suggestions.suggest(prefix, limit)
+
+    @staticmethod
+    def get_items_without_thumbnails(limit, after_id=0):
+        return Item.objects.filter(thumbnails_ready=False, thumbnails_failed=False, \
+                        id__gt=after_id) \
+                .exclude(image='').exclude(image=None).order_by('id')[:limit]
+
+    @staticmethod
+    def make_thumbnails(item, force=False, batch=None):
+        '''
+        writes the missing resized copies of the item's image, or all of them
+        under a new version if force is set, and marks the item as ready.
+        Raises IOError if the image can't be read. With a batch list, the
+        catalog isn't bumped for this item alone: pass the list to
+        thumbnails_changed once the batch is done.
+        '''
+        version = item.thumbnails_version
+        if force:
+            version += 1
+            thumbnails.generate_variants(item.image, version=version)
+        else:
+            missing = thumbnails.missing_variants(item.image, version)
+            if missing:
+                thumbnails.generate_variants(item.image, missing, version)
+        Item.objects.filter(id=item.id).update(thumbnails_ready=True, \
+                thumbnails_version=version, thumbnails_failed=False)
+        replaced = None
+        if version != item.thumbnails_version:
+            replaced = item.thumbnails_version
+        item.thumbnails_ready = True
+        item.thumbnails_version = version
+        item.thumbnails_failed = False
+        if batch is None:
+            Item.thumbnails_changed([(item.image, replaced)])
+        else:
+            batch.append((item.image, replaced))
+
+    @staticmethod
+    def thumbnails_changed(batch):
+        '''
+        bumps the catalog once for a batch of make_thumbnails, so the listings
+        link to the new copies, then deletes the copies they replaced
+        '''
+        if not batch:
+            return
+        catalog_changed()
+        for image, version in batch:
+            if version is not None:
+                thumbnails.delete_variants(image, version)
+
+    @staticmethod
+    def mark_thumbnails_failed(item):
+        ''' stops generate_thumbnails from retrying an image it can't read '''
+        Item.objects.filter(id=item.id).update(thumbnails_failed=True)
+        item.thumbnails_failed = True
 
     @staticmethod
     def delete_item(item):
         if item.claimed:
             Claim.delete_claim(Claim.get_claim(item))
+        ItemKeyword.unindex_item(item)
         item.delete()
+        catalog_changed(removed=[item.name])
 
     @staticmethod
     def get_item_location(item):
-        pass
-    
+        return item.seller_user.location
+
+    @staticmethod
+    def get_items_near(location, radius, category=None, search_query=None, \
+            limit=ITEMS_PER_PAGE, min_price=None, max_price=None):
+        '''
+        returns up to limit unclaimed items sold from within radius meters of
+        location, closest first and then newest first. Each item gets a
+        distance attribute, in meters.
+        '''
+        nearby = Location.get_locations_near(location, radius)
+        if not nearby:
+            return []
+        # the database orders the listings by their seller's distance and
+        # returns only the page that is shown
+        quote = connection.ops.quote_name
+        rank = 'CASE %s.%s %s END' % (quote(User._meta.db_table), quote('location_id'), \
+                ' '.join(['WHEN %s THEN %s'] * len(nearby)))
+        params = []
+        for distance, nearby_location in nearby:
+            params.extend([nearby_location.id, distance])
+        items = list(Item.get_filtered_items(category, search_query, \
+                        min_price=min_price, max_price=max_price) \
+                .filter(seller_user__location__in=[nearby_location.id \
+                        for distance, nearby_location in nearby]) \
+                .extra(select={'distance': rank}, select_params=params) \
+                .order_by('distance', '-upload_time', '-id')[:limit])
+        for item in items:
+            item.distance = float(item.distance)
+        return items
+
+class ItemKeyword(models.Model):
+    ''' inverted index from normalized name/description tokens to unclaimed items '''
+    item = models.ForeignKey(Item)
+    keyword = models.CharField(max_length=KEYWORD_MAX_LENGTH, db_index=True)
+
+    def __unicode__(self):
+        return self.keyword
+
+    class Meta:
+        verbose_name = 'Item Keyword'
+        verbose_name_plural = 'Item Keywords'
+
+    @staticmethod
+    def index_item(item):
+        ItemKeyword.unindex_item(item)
+        ItemKeyword.index_items([item])
+
+    @staticmethod
+    def index_items(items):
+        ''' adds items that are not in the index yet, with batched inserts '''
+        bulk_insert(ItemKeyword, [ItemKeyword(item_id=item.id, keyword=keyword) \
+                for item in items \
+                for keyword in tokenize(item.name, parts=True) | \
+                        tokenize(item.description, parts=True)])
+
+    @staticmethod
+    def unindex_item(item):
+        ItemKeyword.objects.filter(item=item).delete()
+
+    @staticmethod
+    def get_item_ids(keyword):
+        ''' returns the ids of the items with a token starting with keyword '''
+        return ItemKeyword.objects.filter(keyword__startswith=keyword) \
+                .values('item_id')
+
+    @staticmethod
+    def rebuild_index():
+        ItemKeyword.objects.all().delete()
+        for items in in_id_batches(Item.objects.filter(claimed=False)):
+            ItemKeyword.index_items(items)
+
 class Reservation(models.Model):
     # Django will automatically generate this:
     # id = models.IntegerField()
@@ -262,6 +618,7 @@ class Reservation(models.Model):
     def create_reservation(user, search_query, max_price):
         r = Reservation(user=user, search_query=search_query, max_price=max_price)
         r.save()
+        ReservationKeyword.index_reservation(r)
         return r
 
     @staticmethod
@@ -279,27 +636,77 @@ class Reservation(models.Model):
     @staticmethod
     def get_matching_reservations(item):
         ''' returns the reservations that match the item '''
-        matches = {}
-
-        for keyword in item.name.split():
-            reservations = Reservation.objects.filter( \
-                    search_query__icontains=keyword, \
-                    max_price__gte=item.price)
-            for reservation in reservations:
-                if reservation.id in matches:
-                    continue
-                matches[reservation.id] = reservation
-        return matches.values()
+        reservation_ids = ReservationKeyword.get_reservation_ids(item.name, item.price)
+        if reservation_ids is None:
+            return []
+        return list(Reservation.objects.filter(id__in=reservation_ids) \
+                .select_related('user'))
 
     @staticmethod
     def delete_reservation(reservation):
+        ReservationKeyword.unindex_reservation(reservation)
         reservation.delete()
 
+class ReservationKeyword(models.Model):
+    ''' inverted index from reservation search tokens to reservations '''
+    reservation = models.ForeignKey(Reservation)
+    keyword = models.CharField(max_length=KEYWORD_MAX_LENGTH, db_index=True)
+    # copied from the reservation so that the price cut happens in the index
+    max_price = models.DecimalField(max_digits=8, decimal_places=2, db_index=True)
+
+    def __unicode__(self):
+        return self.keyword
+
+    class Meta:
+        verbose_name = 'Reservation Keyword'
+        verbose_name_plural = 'Reservation Keywords'
+
+    @staticmethod
+    def index_reservation(reservation):
+        ReservationKeyword.unindex_reservation(reservation)
+        ReservationKeyword.index_reservations([reservation])
+
+    @staticmethod
+    def index_reservations(reservations):
+        ''' adds reservations that are not in the index yet, with batched inserts '''
+        bulk_insert(ReservationKeyword, [ReservationKeyword( \
+                        reservation_id=reservation.id, keyword=keyword, \
+                        max_price=reservation.max_price) \
+                for reservation in reservations \
+                for keyword in tokenize(reservation.search_query)])
+
+    @staticmethod
+    def unindex_reservation(reservation):
+        ReservationKeyword.objects.filter(reservation=reservation).delete()
+
+    @staticmethod
+    def get_reservation_ids(name, price):
+        '''
+        returns the ids of the reservations that can afford price and have a
+        token starting with one of the tokens of name, or None if name has no
+        tokens
+        '''
+        keywords = tokenize(name)
+        if not keywords:
+            return None
+        query = Q()
+        for keyword in keywords:
+            query |= Q(keyword__startswith=keyword)
+        return ReservationKeyword.objects.filter(query, max_price__gte=price) \
+                .values('reservation_id')
+
+    @staticmethod
+    def rebuild_index():
+        ReservationKeyword.objects.all().delete()
+        for reservations in in_id_batches(Reservation.objects.all()):
+            ReservationKeyword.index_reservations(reservations)
+
 class Claim(models.Model):
     # Django will automatically generate this:
     # id = models.IntegerField()
     buyer = models.ForeignKey(User, related_name='buyer')
-    item = models.ForeignKey(Item)
+    # an item can only be claimed once, even by racing requests
+    item = models.ForeignKey(Item, unique=True)
     timestamp = models.DateTimeField(default=datetime.utcnow)
 
     def __unicode__(self):
@@ -311,17 +718,25 @@ class Claim(models.Model):
 
     @staticmethod
     def create_claim(buyer, item):
-        if item.claimed:
-            raise AssertionError('Item already claimed')
-        c = Claim(buyer=buyer, item=item)
-        c.save()
+        # only the request whose update flips claimed wins the item; a stale
+        # item.claimed can't let a second buyer through
+        with transaction.commit_on_success():
+            if not Item.objects.filter(id=item.id, claimed=False).update(claimed=True):
+                claims.inc(outcome='conflict')
+                raise AssertionError('Item already claimed')
+            c = Claim.objects.create(buyer=buyer, item=item)
+            ItemKeyword.unindex_item(item)
+        catalog_changed(removed=[item.name])
+        claims.inc(outcome='claimed')
         item.claimed = True
-        item.save()
         return c
 
     @staticmethod
     def get_claims(buyer):
-        return Claim.objects.filter(buyer=buyer).order_by('-timestamp')
+        # the claims table shows the seller's location and email on every row
+        return Claim.objects.filter(buyer=buyer) \
+                .select_related('item__seller_user__location') \
+                .order_by('-timestamp')
 
     @staticmethod
     def get_claim(item):
@@ -329,8 +744,121 @@ class Claim(models.Model):
 
     @staticmethod
     def delete_claim(claim):
-        claim.item.claimed = False
-        claim.item.save()
-        claim.delete()
-        
+        with transaction.commit_on_success():
+            Item.objects.filter(id=claim.item_id).update(claimed=False)
+            claim.item.claimed = False
+            ItemKeyword.index_item(claim.item)
+            claim.delete()
+        catalog_changed(added=[claim.item.name])
+
+
+NOTIFICATION_SUBJECT_MAX_LENGTH = 100
+NOTIFICATION_ERROR_MAX_LENGTH = 200
+
+class Notification(models.Model):
+    ''' outbox of emails and SMS waiting to be delivered by send_notifications '''
+    EMAIL = 'email'
+    SMS = 'sms'
+    CHANNEL_CHOICES = (
+        (EMAIL, 'Email'),
+        (SMS, 'SMS'),
+    )
+
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    # how long a worker owns a notification before it is handed out again
+    LEASE = timedelta(minutes=5)
+
+    # Django will automatically generate this:
+    # id = models.IntegerField()
+    user = models.ForeignKey(User)
+    channel = models.CharField(max_length=5, choices=CHANNEL_CHOICES)
+    subject = models.CharField(max_length=NOTIFICATION_SUBJECT_MAX_LENGTH, blank=True)
+    message = models.TextField()
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING, \
+            db_index=True)
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=datetime.utcnow, db_index=True)
+    timestamp = models.DateTimeField(default=datetime.utcnow)
+    last_error = models.CharField(max_length=NOTIFICATION_ERROR_MAX_LENGTH, blank=True)
 
+    def __unicode__(self):
+        return self.channel + ' to ' + unicode(self.user)
+
+    class Meta:
+        verbose_name = 'Notification'
+        verbose_name_plural = 'Notifications'
+
+    @staticmethod
+    def new_email(user, message, subject):
+        return Notification(user=user, channel=Notification.EMAIL, \
+                subject=subject, message=message)
+
+    @staticmethod
+    def new_sms(user, message):
+        return Notification(user=user, channel=Notification.SMS, message=message)
+
+    @staticmethod
+    def queue_notifications(notifications):
+        if notifications:
+            Notification.objects.bulk_create(notifications)
+
+    @staticmethod
+    def get_due_notifications(limit):
+        ''' returns pending notifications, and ones whose worker lease ran out '''
+        return Notification.objects.filter( \
+                status__in=[Notification.PENDING, Notification.SENDING], \
+                next_attempt__lte=datetime.utcnow()) \
+                .select_related('user').order_by('next_attempt')[:limit]
+
+    @staticmethod
+    def claim_due_notifications(limit):
+        '''
+        leases up to limit due notifications to the caller. A notification
+        is only returned to one caller even with several workers running.
+        '''
+        claimed = []
+        for notification in Notification.get_due_notifications(limit):
+            lease_end = datetime.utcnow() + Notification.LEASE
+            updated = Notification.objects.filter(id=notification.id, \
+                    status=notification.status, \
+                    next_attempt=notification.next_attempt) \
+                    .update(status=Notification.SENDING, next_attempt=lease_end)
+            if updated:
+                notification.status = Notification.SENDING
+                notification.next_attempt = lease_end
+                claimed.append(notification)
+        return claimed
+
+    def deliver(self):
+        if self.channel == Notification.EMAIL:
+            self.user.send_email(self.message, self.subject)
+        else:
+            self.user.send_sms(self.message)
+
+    def mark_sent(self):
+        self.status = Notification.SENT
+        self.attempts += 1
+        self.last_error = ''
+        self.save()
+
+    def mark_failed(self, error, max_attempts, backoff):
+        ''' schedules a retry after backoff * 2^attempts seconds, or gives up '''
+        self.attempts += 1
+        self.last_error = unicode(error)[:NOTIFICATION_ERROR_MAX_LENGTH]
+        if self.attempts >= max_attempts:
+            self.status = Notification.FAILED
+        else:
+            self.status = Notification.PENDING
+            self.next_attempt = datetime.utcnow() + \
+                    timedelta(seconds=backoff * 2 ** (self.attempts - 1))
+        self.save()
@@ -0,0 +1,128 @@
+import threading
+import time
+import Queue
+
+from data.models import Notification
+from data.mail import get_mail_transport
+
+class LiveSender(object):
+    '''
+    delivers notifications through the pooled SMTP transport and
+    User.send_sms. The emails of a batch share one SMTP session.
+    '''
+    def send_many(self, notifications):
+        errors = [None] * len(notifications)
+        emails = [i for i, n in enumerate(notifications) if n.channel == Notification.EMAIL]
+        try:
+            email_errors = get_mail_transport().send_many( \
+                    [notifications[i].user.make_email(notifications[i].message, \
+                            notifications[i].subject) for i in emails])
+        except Exception, e:
+            email_errors = [e] * len(emails)
+        for i, error in zip(emails, email_errors):
+            errors[i] = error
+
+        for i, notification in enumerate(notifications):
+            if notification.channel != Notification.EMAIL:
+                try:
+                    notification.deliver()
+                except Exception, e:
+                    errors[i] = e
+        return errors
+
+class FakeSink(object):
+    '''
+    records notifications instead of delivering them, optionally sleeping to
+    stand in for the network round trip. Used to measure throughput offline.
+    '''
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.emails = []
+        self.sms = []
+
+    def send_many(self, notifications):
+        if self.latency:
+            time.sleep(self.latency * len(notifications))
+        with self.lock:
+            for notification in notifications:
+                if notification.channel == Notification.EMAIL:
+                    self.emails.append((notification.user.email, notification.subject, \
+                            notification.message))
+                else:
+                    self.sms.append((notification.user.cell_phone, notification.message))
+        return [None] * len(notifications)
+
+class NotificationWorkerPool(object):
+    '''
+    drains the notification outbox with a fixed number of sender threads.
+
+    Only the dispatching thread touches the database: it leases due
+    notifications, hands them to the workers through a bounded queue, and
+    records the outcome the workers report back. The workers only talk to
+    the mail and SMS services.
+    '''
+    def __init__(self, sender, workers=4, max_attempts=5, backoff=30, batch_size=20):
+        self.sender = sender
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.sent = 0
+        self.failed = 0
+
+    def _work(self, tasks, results):
+        while True:
+            batch = tasks.get()
+            if batch is None:
+                return
+            try:
+                errors = self.sender.send_many(batch)
+            except Exception, e:
+                errors = [e] * len(batch)
+            for notification, error in zip(batch, errors):
+                results.put((notification, error))
+
+    def drain(self):
+        ''' delivers every notification that is due, returns the number handled '''
+        capacity = self.workers * self.batch_size * 2
+        tasks = Queue.Queue(maxsize=self.workers * 2)
+        results = Queue.Queue()
+        threads = [threading.Thread(target=self._work, args=(tasks, results)) \
+                for i in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        handled = 0
+        in_flight = 0
+        try:
+            while True:
+                # top up once half of the leased notifications are done
+                if in_flight <= capacity / 2:
+                    claimed = Notification.claim_due_notifications(capacity - in_flight)
+                    for i in range(0, len(claimed), self.batch_size):
+                        tasks.put(claimed[i:i + self.batch_size])
+                    in_flight += len(claimed)
+                if in_flight == 0:
+                    break
+                notification, error = results.get()
+                in_flight -= 1
+                handled += 1
+                if error is None:
+                    notification.mark_sent()
+                    self.sent += 1
+                else:
+                    notification.mark_failed(error, self.max_attempts, self.backoff)
+                    self.failed += 1
+        finally:
+            for thread in threads:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
+        return handled
+
+    def run_forever(self, poll_interval):
+        while True:
+            if not self.drain():
+                time.sleep(poll_interval)
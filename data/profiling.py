@@ -0,0 +1,102 @@
+import json
+import logging
+import threading
+import time
+
+from django.db import connection
+from django.template.base import Template
+
+logger = logging.getLogger('data.profiling')
+
+# the profile of the request being handled by this thread, if it is sampled
+current = threading.local()
+
+class RequestProfile(object):
+    '''
+    where a request's time went: SQL (from the connection's debug cursor),
+    template rendering and the view, plus the request as a whole
+    '''
+    def __init__(self, request):
+        self.path = request.path
+        self.method = request.method
+        self.start = time.time()
+        self.old_use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        self.first_query = len(connection.queries)
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.view_name = None
+        self.view_start = None
+        self.view_time = None
+        self.total_time = None
+        self.queries = None
+
+    def start_view(self, view_func):
+        self.view_name = getattr(view_func, '__name__', repr(view_func))
+        self.view_start = time.time()
+
+    def finish(self):
+        ''' stops the clocks and gives the connection back its debug cursor setting '''
+        now = time.time()
+        self.total_time = now - self.start
+        if self.view_start is not None:
+            self.view_time = now - self.view_start
+        self.queries = connection.queries[self.first_query:]
+        connection.use_debug_cursor = self.old_use_debug_cursor
+
+    @property
+    def sql_time(self):
+        return sum(float(query['time']) for query in self.queries)
+
+    def slowest_queries(self, count):
+        return sorted(self.queries, key=lambda query: float(query['time']), \
+                reverse=True)[:count]
+
+    def server_timing(self):
+        ''' the Server-Timing header value, in milliseconds '''
+        timings = [
+            'db;dur=%.1f;desc="%d queries"' % (1000 * self.sql_time, len(self.queries)),
+            'tpl;dur=%.1f' % (1000 * self.template_time),
+        ]
+        if self.view_time is not None:
+            timings.append('view;dur=%.1f' % (1000 * self.view_time))
+        timings.append('total;dur=%.1f' % (1000 * self.total_time))
+        return ', '.join(timings)
+
+    def as_dict(self, slow_queries=3, sql_length=200):
+        return {
+            'method': self.method,
+            'path': self.path,
+            'view': self.view_name,
+            'total_ms': round(1000 * self.total_time, 1),
+            'view_ms': None if self.view_time is None else round(1000 * self.view_time, 1),
+            'template_ms': round(1000 * self.template_time, 1),
+            'sql_ms': round(1000 * self.sql_time, 1),
+            'queries': len(self.queries),
+            'slowest': [{'ms': round(1000 * float(query['time']), 1), \
+                    'sql': query['sql'][:sql_length]} \
+                    for query in self.slowest_queries(slow_queries)],
+        }
+
+    def log(self, slow_queries=3):
+        logger.info(json.dumps(self.as_dict(slow_queries), sort_keys=True))
+
+template_render = Template.render
+
+def profiled_render(self, context):
+    profile = getattr(current, 'profile', None)
+    if profile is None:
+        return template_render(self, context)
+    # included and extended templates are counted in the outermost one
+    profile.template_depth += 1
+    start = time.time()
+    try:
+        return template_render(self, context)
+    finally:
+        profile.template_depth -= 1
+        if profile.template_depth == 0:
+            profile.template_time += time.time() - start
+
+def install_template_timer():
+    ''' times Template.render from now on; only done once profiling is turned on '''
+    Template.render = profiled_render
@@ -0,0 +1,25 @@
+import re
+
+KEYWORD_MAX_LENGTH = 50
+
+# words, keeping inner dots and dashes so that '3.091' and 't-shirt' stay whole
+TOKEN_RE = re.compile(r'\w+(?:[.\-]\w+)*', re.UNICODE)
+
+def tokenize(text, parts=False):
+    '''
+    returns the set of normalized search tokens in text. With parts, the
+    pieces of hyphenated tokens are included too, so that listings indexed
+    that way are found by 'shirt' as well as 't-shirt'.
+    '''
+    if not text:
+        return set()
+    tokens = set(TOKEN_RE.findall(text.lower()))
+    if parts:
+        tokens.update([part for token in tokens for part in token.split('-')])
+    return set(token[:KEYWORD_MAX_LENGTH] for token in tokens)
+
+def normalize(text):
+    ''' lowercases text and keeps only its words, in order, for prefix matching '''
+    if not text:
+        return u''
+    return u' '.join(TOKEN_RE.findall(text.lower()))
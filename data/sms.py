@@ -0,0 +1,145 @@
+import collections
+import threading
+import time
+import Queue
+
+from site_specific_constants import GEDDIT_GMAIL, GEDDIT_PASSWORD, SMS_BACKEND, \
+        SMS_SESSION_TTL, SMS_RATE_LIMIT
+
+class GoogleVoiceBackend(object):
+    def __init__(self, email, password):
+        self.email = email
+        self.password = password
+        self.voice = None
+
+    def login(self):
+        from googlevoice import Voice
+        voice = Voice()
+        voice.login(self.email, self.password)
+        self.voice = voice
+
+    def send(self, phone, message):
+        self.voice.send_sms(phone, message)
+
+class StubBackend(object):
+    ''' keeps the messages instead of sending them, for tests and load runs '''
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.logins = 0
+        self.messages = []
+
+    def login(self):
+        self.logins += 1
+
+    def send(self, phone, message):
+        if self.latency:
+            time.sleep(self.latency)
+        self.messages.append((phone, message))
+
+class SMSGateway(object):
+    '''
+    sends text messages through a backend with a single shared session.
+
+    The backend logs in on first use and again once the session is older
+    than session_ttl seconds, or when a send fails on an existing session.
+    Messages are spaced at most rate per second apart. queue() hands a
+    message to a background thread instead of waiting for it.
+    '''
+    def __init__(self, backend, session_ttl=3600, rate=1.0, queue_size=1000):
+        self.backend = backend
+        self.session_ttl = session_ttl
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.logged_in_at = None
+        self.next_send = 0.0
+        self.logins = 0
+        self.sent = 0
+        self.failed = 0
+        self.latencies = collections.deque(maxlen=1000)
+        self.outbox = Queue.Queue(maxsize=queue_size)
+        self.thread = None
+
+    def _login(self):
+        self.backend.login()
+        self.logged_in_at = time.time()
+        self.logins += 1
+
+    def _wait_for_slot(self):
+        now = time.time()
+        wait = self.next_send - now
+        self.next_send = max(now, self.next_send) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def send(self, phone, message):
+        start = time.time()
+        with self.lock:
+            self._wait_for_slot()
+            try:
+                if self.logged_in_at is None or \
+                        time.time() - self.logged_in_at > self.session_ttl:
+                    self._login()
+                try:
+                    self.backend.send(phone, message)
+                except Exception:
+                    # the session may have expired early, log in again once
+                    self._login()
+                    self.backend.send(phone, message)
+            except Exception:
+                self.failed += 1
+                self.logged_in_at = None
+                raise
+            self.sent += 1
+            self.latencies.append(time.time() - start)
+
+    def queue(self, phone, message):
+        ''' sends the message from the background thread, blocking only if the queue is full '''
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._drain)
+                self.thread.daemon = True
+                self.thread.start()
+        self.outbox.put((phone, message))
+
+    def _drain(self):
+        while True:
+            phone, message = self.outbox.get()
+            try:
+                self.send(phone, message)
+            except Exception:
+                pass
+            finally:
+                self.outbox.task_done()
+
+    def flush(self):
+        ''' waits for every queued message to be sent '''
+        self.outbox.join()
+
+    def get_stats(self):
+        latencies = sorted(self.latencies)
+        stats = {
+            'sent': self.sent,
+            'failed': self.failed,
+            'logins': self.logins,
+            'queued': self.outbox.qsize(),
+        }
+        if latencies:
+            stats['latency_avg'] = sum(latencies) / len(latencies)
+            stats['latency_p95'] = latencies[int(len(latencies) * 0.95)]
+            stats['latency_max'] = latencies[-1]
+        return stats
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_sms_gateway():
+    ''' returns the process-wide SMS gateway, using the backend named by SMS_BACKEND '''
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            if SMS_BACKEND == 'stub':
+                backend = StubBackend()
+            else:
+                backend = GoogleVoiceBackend(GEDDIT_GMAIL, GEDDIT_PASSWORD)
+            _gateway = SMSGateway(backend, SMS_SESSION_TTL, SMS_RATE_LIMIT)
+        return _gateway
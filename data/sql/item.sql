@@ -0,0 +1,8 @@
+-- Composite indexes for the buy page, which Django 1.4 can't declare on the
+-- model. syncdb and sqlall (sync_db.sh) add them after creating data_item.
+-- Newest listings, optionally in one category
+CREATE INDEX data_item_claimed_category_upload ON data_item (claimed, category_id, upload_time);
+CREATE INDEX data_item_claimed_upload ON data_item (claimed, upload_time);
+-- Listings by price and price ranges, optionally in one category
+CREATE INDEX data_item_claimed_category_price ON data_item (claimed, category_id, price);
+CREATE INDEX data_item_claimed_price ON data_item (claimed, price);
@@ -0,0 +1,27 @@
+// Loads the next page of listings when the user scrolls near the bottom,
+// replacing the "Next page" link.
+var gedditLoadingMore = false;
+
+function gedditLoadMoreListings() {
+    var link = $(".next-page-link");
+    if (gedditLoadingMore || link.length == 0) {
+        return;
+    }
+    gedditLoadingMore = true;
+    $.getJSON(link.data("more-url"), function(response) {
+        $("#buy-table tbody").append(response.html);
+        if (response.next) {
+            link.attr("href", link.attr("href").split("?")[0] + "?" + response.next_page_query);
+            link.data("more-url", link.data("more-url").split("?")[0] + "?" + response.next_page_query);
+        } else {
+            $("#buy-next-page").remove();
+        }
+        gedditLoadingMore = false;
+    });
+}
+
+$(window).scroll(function() {
+    if ($(window).scrollTop() + $(window).height() > $(document).height() - 200) {
+        gedditLoadMoreListings();
+    }
+});
@@ -0,0 +1,33 @@
+// Suggests item and category names in the search bar as the user types.
+var gedditSuggestTimer = null;
+var gedditLastPrefix = "";
+
+function gedditSuggest(input) {
+    var prefix = $.trim(input.val());
+    if (prefix == gedditLastPrefix) {
+        return;
+    }
+    gedditLastPrefix = prefix;
+    if (prefix.length == 0) {
+        $("#search-suggestions").empty();
+        return;
+    }
+    $.getJSON(input.data("suggest-url"), {q: prefix}, function(response) {
+        if (prefix != gedditLastPrefix) {
+            // a newer request is on its way
+            return;
+        }
+        var list = $("#search-suggestions").empty();
+        $.each(response.suggestions, function(i, suggestion) {
+            list.append($("<option>").attr("value", suggestion.text));
+        });
+    });
+}
+
+$(function() {
+    $(".search_bar").on("input", function() {
+        var input = $(this);
+        clearTimeout(gedditSuggestTimer);
+        gedditSuggestTimer = setTimeout(function() { gedditSuggest(input); }, 100);
+    });
+});
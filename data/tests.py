@@ -5,8 +5,96 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
-from django.test import TestCase
-from data.models import User, Category, Item, Claim, Location, Reservation
+import asyncore
+import csv
+import os
+import shutil
+import tempfile
+import smtpd
+import smtplib
+import socket
+import threading
+import json
+import logging
+import time
+from datetime import datetime
+from decimal import Decimal
+from email.mime.text import MIMEText
+from cStringIO import StringIO
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+from django.db import connection, reset_queries, DatabaseError, IntegrityError
+from django.core.signals import request_started
+from django.test import TestCase, TransactionTestCase
+from django.test.client import Client, RequestFactory
+from django.test.utils import override_settings
+from django.utils.unittest import skipIf
+from django.http import HttpRequest, Http404
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.template import Context, Template
+from django.contrib.auth.models import User as AuthUser, Group
+from data.models import catalog_version, category_cache, suggestions, User, Category, Item, ItemKeyword, Claim, Location, Reservation, \
+        ReservationKeyword, Notification
+from data.notifications import NotificationWorkerPool, FakeSink, LiveSender
+from data.mail import SMTPTransport
+from data.sms import SMSGateway, StubBackend
+from data.views import listings_cache, CSRF_PLACEHOLDER
+from data.views_lib import encode_cursor, decode_cursor
+from data.middleware import CurrentUserMiddleware
+from data import cache as data_cache, profiling
+from data.metrics import Registry, registry
+import mit
+from mit import directory
+from mit.directory import DirectoryClient, FakeDirectory
+from mit import zwrite
+from mit.zwrite import ZephyrNotifier
+from data import thumbnails
+from data.media import serve_media
+from data.dashboard import load_dashboard
+from data.benchmark import Benchmark, percentile, compare
+from data.loader import BulkLoader, LoadError
+from data.export import export, get_rows, ExportError
+from data.typeahead import PrefixIndex, Typeahead
+from site_specific_functions import get_current_user
+from data.search import tokenize
+
+class QueryBudget(object):
+    '''
+    context manager that fails the test if the block runs more than budget
+    queries. The failure message lists the queries that were run.
+    '''
+    def __init__(self, test_case, budget):
+        self.test_case = test_case
+        self.budget = budget
+
+    def __enter__(self):
+        self.old_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        # requests made with the test client would clear connection.queries
+        request_started.disconnect(reset_queries)
+        self.start = len(connection.queries)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        connection.use_debug_cursor = self.old_debug_cursor
+        request_started.connect(reset_queries)
+        self.queries = connection.queries[self.start:]
+        if exc_type is not None:
+            return
+        self.test_case.assertTrue(len(self.queries) <= self.budget, \
+                '%d queries run, budget is %d:\n%s' % (len(self.queries), self.budget, \
+                '\n'.join(query['sql'] for query in self.queries)))
+
+class QueryBudgetMixin(object):
+    def assertMaxQueries(self, budget):
+        return QueryBudget(self, budget)
 
 class UserTest(TestCase):
     USERNAME = 'asdf1234'
@@ -75,6 +163,26 @@ class CategoryTest(TestCase):
         self.assertEqual(all_categories[0], self.category2)
         self.assertEqual(all_categories[1], self.category) 
 
+    def test_category_cache(self):
+        self.assertEqual(Category.get_cached_categories(), \
+                list(Category.get_all_categories()))
+        hits = category_cache.hits
+        self.assertEqual(Category.get_cached_categories(), [self.category2, self.category])
+        self.assertEqual(category_cache.hits, hits + 1)
+
+        # creating or deleting a category invalidates the cache
+        misses = category_cache.misses
+        category3 = Category.create_category('18.01')
+        self.assertIn(category3, Category.get_cached_categories())
+        Category.delete_category(category3)
+        self.assertNotIn(category3, Category.get_cached_categories())
+        self.assertEqual(category_cache.misses, misses + 2)
+
+        # so does renaming one, as the admin would
+        self.category.name = '0.000'
+        self.category.save()
+        self.assertEqual(Category.get_cached_categories()[0].name, '0.000')
+
 class ItemTest(TestCase):
     USERNAME = 'asdf1234'
     FIRST_NAME = 'Asdf'
@@ -177,6 +285,96 @@ class ItemTest(TestCase):
         self.assertIn(self.video_5111, principles)
         self.assertIn(self.cheat_sheets, principles)
 
+    def test_filter_by_multiple_keywords(self):
+        # every keyword has to match, by token prefix and regardless of case
+        sheets = Item.get_filtered_items(search_query='CHEAT 3.091')
+        self.assertEqual(len(sheets), 1)
+        self.assertIn(self.cheat_sheets, sheets)
+
+        lectures = Item.get_filtered_items(search_query='vid lect')
+        self.assertEqual(len(lectures), 1)
+        self.assertIn(self.video_5111, lectures)
+
+        # descriptions are searchable too
+        legendary = Item.get_filtered_items(search_query='legendary')
+        self.assertIn(self.textbook_3091_1, legendary)
+        self.assertIn(self.textbook_3091_2, legendary)
+        self.assertNotIn(self.video_5111, legendary)
+
+        self.assertEqual(len(Item.get_filtered_items(search_query='textbook video')), 0)
+
+    def test_filter_by_hyphenated_word(self):
+        shirt = self.user.add_item('MIT T-Shirt', 'Worn once', self.girs, '10.00')
+        for search_query in ['shirt', 'T-Shirt', 't-sh', 'mit shirt']:
+            self.assertEqual(list(Item.get_filtered_items(search_query=search_query)), [shirt])
+
+    def test_filter_by_punctuation(self):
+        # nothing is indexed under punctuation, so nothing matches it
+        self.assertEqual(len(Item.get_filtered_items(search_query='!?')), 0)
+        # a blank query is no search at all
+        self.assertEqual(len(Item.get_filtered_items(search_query=' ')), 4)
+
+    def test_item_pages(self):
+        # walk the listings three at a time
+        page1, cursor = Item.get_item_page(page_size=3)
+        self.assertEqual(len(page1), 3)
+        self.assertNotEqual(cursor, None)
+        page2, cursor = Item.get_item_page(after=cursor, page_size=3)
+        self.assertEqual(len(page2), 1)
+        self.assertEqual(cursor, None)
+
+        self.assertEqual(page1 + page2, list(Item.get_filtered_items()))
+
+        # the cursor survives a trip through the URL
+        self.assertEqual(decode_cursor(encode_cursor((page1[-1].upload_time, page1[-1].id))), \
+                (page1[-1].upload_time, page1[-1].id))
+        self.assertEqual(decode_cursor('garbage'), None)
+
+    def test_item_pages_same_upload_time(self):
+        # items listed in the same instant are split by id
+        Item.objects.all().update(upload_time=self.textbook_3091_1.upload_time)
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = Item.get_item_page(after=cursor, page_size=1)
+            seen.extend(page)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(item.id for item in seen)), 4)
+
+    def test_filter_by_price(self):
+        items = Item.get_filtered_items(min_price=Decimal('25'), max_price=Decimal('30.00'))
+        self.assertEqual(set(items), set([self.textbook_3091_1, self.textbook_3091_2]))
+        self.assertEqual(list(Item.get_filtered_items(max_price=Decimal('20'))), \
+                [self.cheat_sheets])
+        self.assertEqual(list(Item.get_filtered_items(min_price=Decimal('50'), \
+                category=self.videos)), [self.video_5111])
+
+    def test_item_pages_by_price(self):
+        for sort, expected in [(Item.PRICE_LOW, [self.cheat_sheets, self.textbook_3091_1, \
+                    self.textbook_3091_2, self.video_5111]), \
+                (Item.PRICE_HIGH, [self.video_5111, self.textbook_3091_2, \
+                    self.textbook_3091_1, self.cheat_sheets])]:
+            seen = []
+            cursor = None
+            while True:
+                page, cursor = Item.get_item_page(after=cursor, page_size=1, sort=sort)
+                seen.extend(page)
+                if cursor is None:
+                    break
+                # the cursor goes through the URL between pages
+                cursor = decode_cursor(encode_cursor(cursor), sort)
+            self.assertEqual(seen, expected)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('3.091, 5.111 Cheat-Sheets!'), \
+                set(['3.091', '5.111', 'cheat-sheets']))
+        self.assertEqual(tokenize('3.091 Cheat-Sheets', parts=True), \
+                set(['3.091', 'cheat-sheets', 'cheat', 'sheets']))
+        self.assertEqual(tokenize(''), set())
+        self.assertEqual(tokenize(None), set())
+
     def test_filter_by_id(self):
         textbook_1 = Item.get_filtered_items(id=self.textbook_3091_1.id)
         self.assertEqual(len(textbook_1), 1)
@@ -304,6 +502,90 @@ class ClaimTest(TestCase):
         # check that there is no claim on the item
         self.assertEqual(len(self.buyer.get_claims()), 0)
 
+    def test_claim_updates_search_index(self):
+        self.assertIn(self.item1, Item.get_filtered_items(search_query='Sadoway'))
+
+        # claimed items drop out of the keyword index
+        claim = self.buyer.add_claim(self.item1)
+        self.assertEqual(ItemKeyword.objects.filter(item=self.item1).count(), 0)
+        self.assertNotIn(self.item1, Item.get_filtered_items(search_query='Sadoway'))
+
+        # and come back when they are unclaimed
+        self.buyer.remove_claim(self.item1)
+        self.item1 = Item.get_item_by_id(self.item1.id)
+        self.assertIn(self.item1, Item.get_filtered_items(search_query='Sadoway'))
+
+class ClaimRaceTest(TransactionTestCase):
+    BUYERS = 8
+
+    def setUp(self):
+        self.seller = User.create_user('seller', 'Sell', 'Er', 'seller@mit.edu')
+        self.buyers = [User.create_user('buyer%d' % i, 'Buy', 'Er', 'buyer%d@mit.edu' % i) \
+                for i in range(self.BUYERS)]
+        self.item = Item.create_item(self.seller, 'Wooden Chair', 'Slightly worn.', \
+                Category.create_category('Furniture'), '24.97')
+
+    def test_stale_item_loses(self):
+        # both buyers loaded the item before either claimed it
+        first = Item.get_item_by_id(self.item.id)
+        second = Item.get_item_by_id(self.item.id)
+        self.buyers[0].add_claim(first)
+        self.assertFalse(second.claimed)
+        self.assertRaises(AssertionError, self.buyers[1].add_claim, second)
+        self.assertEqual(Claim.get_claim(self.item).buyer, self.buyers[0])
+        self.assertEqual(Claim.objects.count(), 1)
+
+    def test_item_is_unique(self):
+        Claim.objects.create(buyer=self.buyers[0], item=self.item)
+        self.assertRaises(IntegrityError, Claim.objects.create, buyer=self.buyers[1], \
+                item=self.item)
+
+    def test_claim_view_reports_losing(self):
+        buyer = User.create_user('pwh', 'Paul', 'Hemberger', 'pwh@mit.edu')
+        self.buyers[0].add_claim(self.item)
+        response = Client().post('/claim', {'item_id': self.item.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('already+been+claimed', response['Location'])
+        self.assertEqual(Claim.objects.get().buyer, self.buyers[0])
+        self.assertEqual(Notification.objects.count(), 0)
+        self.assertEqual(buyer.get_claims().count(), 0)
+
+    @skipIf(connection.vendor == 'sqlite' and \
+            connection.settings_dict['TEST_NAME'] in (None, '', ':memory:'), \
+            'threads cannot share an in-memory sqlite database')
+    def test_parallel_claims(self):
+        start = threading.Event()
+        winners = []
+        losers = []
+
+        def claim(buyer):
+            start.wait()
+            try:
+                buyer.add_claim(Item.get_item_by_id(self.item.id))
+                winners.append(buyer)
+            except (AssertionError, IntegrityError, DatabaseError):
+                losers.append(buyer)
+            finally:
+                connection.close()
+
+        for round in range(5):
+            threads = [threading.Thread(target=claim, args=(buyer,)) for buyer in self.buyers]
+            for thread in threads:
+                thread.start()
+            start.set()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(winners), 1)
+            self.assertEqual(len(losers), self.BUYERS - 1)
+            self.assertEqual(Claim.get_claim(self.item).buyer, winners[0])
+            self.assertEqual(Claim.objects.count(), 1)
+            self.assertTrue(Item.get_item_by_id(self.item.id).claimed)
+
+            winners[0].remove_claim(self.item)
+            start.clear()
+            del winners[:]
+            del losers[:]
+
 class ReservationTest(TestCase):
     USERNAME = 'asdf1234'
     FIRST_NAME = 'Asdf'
@@ -375,3 +657,1337 @@ class ReservationTest(TestCase):
         # we don't expect to match anything
         video = Reservation.get_matching_reservations(self.item3)
         self.assertEqual(len(video), 0)
+
+    def test_matching_reservations_index(self):
+        # a reservation matching several words of the name is returned once
+        reservation = self.user.add_reservation('cheap 8.01 textbooks', self.MAX_PRICE)
+        physics = Reservation.get_matching_reservations(self.item1)
+        self.assertEqual(len(physics), 2)
+        self.assertIn(self.reservation1, physics)
+        self.assertIn(reservation, physics)
+
+        # deleted reservations are dropped from the index
+        self.user.remove_reservation(reservation)
+        self.assertEqual(ReservationKeyword.objects.filter( \
+                reservation__id=reservation.id).count(), 0)
+        self.assertEqual(len(Reservation.get_matching_reservations(self.item1)), 1)
+
+class FailingSender(object):
+    def send_many(self, notifications):
+        raise IOError('connection refused')
+
+class NotificationTest(TestCase):
+    LOCATION = Location.create_location('zxcv', '42.35', '-71.09')
+
+    def setUp(self):
+        self.category = Category.create_category('Textbooks')
+        self.seller = User.create_user('seller', 'S', 'Eller', 'seller@mit.edu', \
+                '(123)456-7890', self.LOCATION)
+        self.buyer = User.create_user('buyer', 'B', 'Uyer', 'buyer@mit.edu', \
+                '(987)654-3210', self.LOCATION, sms_notifications=True)
+        self.buyer.add_reservation('8.01 textbook', '50.00')
+
+    def test_add_item_queues_notifications(self):
+        item = self.seller.add_item('8.01 Textbook', 'used', self.category, '20.00')
+
+        notifications = Notification.objects.filter(user=self.buyer)
+        self.assertEqual(len(notifications), 2)
+        for notification in notifications:
+            self.assertEqual(notification.status, Notification.PENDING)
+            self.assertIn('buy?id=' + str(item.id), notification.message)
+        self.assertEqual(set(n.channel for n in notifications), \
+                set([Notification.EMAIL, Notification.SMS]))
+
+    def test_worker_pool_delivers(self):
+        self.seller.add_item('8.01 Textbook', 'used', self.category, '20.00')
+
+        sink = FakeSink()
+        pool = NotificationWorkerPool(sink, workers=2)
+        self.assertEqual(pool.drain(), 2)
+        self.assertEqual(len(sink.emails), 1)
+        self.assertEqual(sink.emails[0][0], 'buyer@mit.edu')
+        self.assertEqual(len(sink.sms), 1)
+        self.assertEqual(Notification.objects.filter(status=Notification.SENT).count(), 2)
+
+        # nothing is left to send
+        self.assertEqual(pool.drain(), 0)
+
+    def test_worker_pool_retries(self):
+        self.seller.add_item('8.01 Textbook', 'used', self.category, '20.00')
+
+        pool = NotificationWorkerPool(FailingSender(), workers=1, max_attempts=2, backoff=0)
+        self.assertEqual(pool.drain(), 4)
+        for notification in Notification.objects.all():
+            self.assertEqual(notification.status, Notification.FAILED)
+            self.assertEqual(notification.attempts, 2)
+            self.assertEqual(notification.last_error, 'connection refused')
+
+    def test_claim_is_exclusive(self):
+        self.seller.add_item('8.01 Textbook', 'used', self.category, '20.00')
+
+        self.assertEqual(len(Notification.claim_due_notifications(10)), 2)
+        # leased notifications are not handed out twice
+        self.assertEqual(len(Notification.claim_due_notifications(10)), 0)
+
+class LocalSMTPServer(smtpd.SMTPServer):
+    ''' stand-in SMTP server that keeps the messages it receives '''
+    def __init__(self):
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', 0), None)
+        self.port = self.socket.getsockname()[1]
+        self.messages = []
+        self.connections = 0
+        self.thread = threading.Thread(target=asyncore.loop, \
+                kwargs={'timeout': 0.05, 'map': self._map})
+        self.thread.daemon = True
+        self.thread.start()
+
+    def handle_accept(self):
+        self.connections += 1
+        smtpd.SMTPServer.handle_accept(self)
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        self.messages.append((mailfrom, rcpttos, data))
+
+    def stop(self):
+        for channel in self._map.values():
+            channel.close()
+        self.thread.join()
+
+class SMTPTransportTest(TestCase):
+    def setUp(self):
+        self.server = LocalSMTPServer()
+        self.transport = SMTPTransport('127.0.0.1', self.server.port, max_messages=4)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def make_email(self, i):
+        msg = MIMEText('message %d' % i)
+        msg['Subject'] = 'subject %d' % i
+        msg['From'] = 'geddit@mit.edu'
+        msg['To'] = 'user%d@mit.edu' % i
+        return msg
+
+    def test_send_many_reuses_sessions(self):
+        errors = self.transport.send_many([self.make_email(i) for i in range(6)])
+        self.assertEqual(errors, [None] * 6)
+        self.transport.send(self.make_email(6))
+        self.transport.close()
+
+        self.assertEqual(len(self.server.messages), 7)
+        self.assertEqual(self.server.messages[0][1], ['user0@mit.edu'])
+        # a session is recycled after max_messages messages
+        self.assertEqual(self.transport.connections_opened, 2)
+
+    def test_reconnects_dropped_session(self):
+        self.transport.send(self.make_email(0))
+        # the server hangs up on the pooled session
+        for channel in self.server._map.values():
+            if channel is not self.server:
+                channel.close()
+        self.transport.send(self.make_email(1))
+        self.assertEqual(len(self.server.messages), 2)
+        self.assertEqual(self.transport.connections_opened, 2)
+
+    def refuse_after(self, count):
+        ''' a connection_class that can only connect count times '''
+        opened = []
+        def connect(host, port):
+            if len(opened) >= count:
+                raise socket.error('Connection refused')
+            opened.append(port)
+            return smtplib.SMTP(host, port)
+        return connect
+
+    def test_failed_recycle(self):
+        transport = SMTPTransport('127.0.0.1', self.server.port, max_messages=4, \
+                connection_class=self.refuse_after(1))
+        errors = transport.send_many([self.make_email(i) for i in range(6)])
+        # the first four were delivered, so only the rest are failures
+        self.assertEqual(errors[:4], [None] * 4)
+        self.assertTrue(isinstance(errors[4], socket.error))
+        self.assertTrue(isinstance(errors[5], socket.error))
+        self.assertEqual(len(self.server.messages), 4)
+
+    def test_failed_reconnect(self):
+        transport = SMTPTransport('127.0.0.1', self.server.port, \
+                connection_class=self.refuse_after(1))
+        transport.send(self.make_email(0))
+        for channel in self.server._map.values():
+            if channel is not self.server:
+                channel.close()
+        errors = transport.send_many([self.make_email(i) for i in range(1, 3)])
+        self.assertTrue(isinstance(errors[0], socket.error))
+        self.assertTrue(isinstance(errors[1], socket.error))
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_live_sender_is_measured(self):
+        from data import mail
+        seconds = registry.metrics['geddit_notification_send_seconds']
+        sent = seconds.get(channel='email')[0]
+        user = User.create_user('kxing', 'Kerry', 'Xing', 'kxing@mit.edu')
+        transport_before, mail._transport = mail._transport, self.transport
+        try:
+            errors = LiveSender().send_many([Notification.new_email(user, 'message %d' % i, \
+                    'subject') for i in range(3)])
+        finally:
+            mail._transport = transport_before
+        self.assertEqual(errors, [None] * 3)
+        # every email of the outbox batch is timed
+        self.assertEqual(seconds.get(channel='email')[0], sent + 3)
+
+class ExpiringBackend(StubBackend):
+    ''' stub whose session stops working after a number of messages '''
+    def __init__(self, messages_per_session):
+        StubBackend.__init__(self)
+        self.messages_per_session = messages_per_session
+        self.session_messages = 0
+
+    def login(self):
+        StubBackend.login(self)
+        self.session_messages = 0
+
+    def send(self, phone, message):
+        if self.session_messages >= self.messages_per_session:
+            raise IOError('session expired')
+        self.session_messages += 1
+        StubBackend.send(self, phone, message)
+
+class SMSGatewayTest(TestCase):
+    PHONE = '(123)456-7890'
+
+    def test_reuses_session(self):
+        backend = StubBackend()
+        gateway = SMSGateway(backend, rate=None)
+        for i in range(5):
+            gateway.send(self.PHONE, 'message %d' % i)
+        self.assertEqual(backend.logins, 1)
+        self.assertEqual(len(backend.messages), 5)
+
+        stats = gateway.get_stats()
+        self.assertEqual(stats['sent'], 5)
+        self.assertEqual(stats['failed'], 0)
+        self.assertIn('latency_p95', stats)
+
+    def test_renews_expired_session(self):
+        backend = ExpiringBackend(2)
+        gateway = SMSGateway(backend, rate=None)
+        for i in range(5):
+            gateway.send(self.PHONE, 'message %d' % i)
+        self.assertEqual(backend.logins, 3)
+        self.assertEqual(len(backend.messages), 5)
+
+        # a session older than the TTL is renewed before sending
+        gateway.session_ttl = -1
+        gateway.send(self.PHONE, 'message')
+        self.assertEqual(backend.logins, 4)
+
+    def test_queue_and_rate_limit(self):
+        backend = StubBackend()
+        gateway = SMSGateway(backend, rate=50)
+        start = time.time()
+        for i in range(5):
+            gateway.queue(self.PHONE, 'message %d' % i)
+        gateway.flush()
+        self.assertEqual(len(backend.messages), 5)
+        # five messages at 50 per second take at least four intervals
+        self.assertTrue(time.time() - start >= 0.08)
+
+class LocationTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.maseeh = Location.create_location('Maseeh Hall', '42.35764801061463', \
+                '-71.09338732275393')
+        self.mccormick = Location.create_location('McCormick Hall', '42.35731', '-71.09454')
+        self.baker = Location.create_location('Baker Hall', '42.35666', '-71.09582')
+        self.next_house = Location.create_location('Next House', '42.354714540813504', \
+                '-71.10203476461794')
+        self.category = Category.create_category('Furniture')
+
+    def test_distance(self):
+        self.assertAlmostEqual(self.maseeh.distance_to(self.maseeh), 0)
+        # McCormick is across the street from Maseeh
+        self.assertTrue(90 < self.maseeh.distance_to(self.mccormick) < 110)
+        self.assertTrue(750 < self.maseeh.distance_to(self.next_house) < 800)
+
+    def test_locations_near(self):
+        nearby = Location.get_locations_near(self.maseeh, 300)
+        self.assertEqual([location for distance, location in nearby], \
+                [self.maseeh, self.mccormick, self.baker])
+        self.assertEqual(len(Location.get_locations_near(self.maseeh, 1000)), 4)
+
+    def test_items_near(self):
+        sellers = {}
+        for location in [self.next_house, self.baker, self.maseeh]:
+            sellers[location.id] = User.create_user(location.name[:10], 'S', 'E', \
+                    'seller@mit.edu', None, location)
+        far_chair = Item.create_item(sellers[self.next_house.id], 'Chair', 'far', \
+                self.category, '5.00')
+        chair = Item.create_item(sellers[self.baker.id], 'Chair', 'near', \
+                self.category, '5.00')
+        couch = Item.create_item(sellers[self.maseeh.id], 'Couch', 'here', \
+                self.category, '5.00')
+
+        items = Item.get_items_near(self.maseeh, 500)
+        self.assertEqual(items, [couch, chair])
+        self.assertAlmostEqual(items[0].distance, 0)
+
+        self.assertEqual(Item.get_items_near(self.maseeh, 1000, search_query='chair'), \
+                [chair, far_chair])
+        # one query for the nearby locations, one for the page of listings
+        with self.assertNumQueries(2):
+            self.assertEqual(Item.get_items_near(self.maseeh, 1000, limit=1), [couch])
+        self.assertEqual(Item.get_item_location(chair), self.baker)
+
+class ThumbnailTest(TestCase):
+    def setUp(self):
+        # keep the uploads out of MEDIA_ROOT
+        self.media_root = tempfile.mkdtemp()
+        self.image_field = Item._meta.get_field('image')
+        self.old_storage = self.image_field.storage
+        self.image_field.storage = FileSystemStorage(location=self.media_root, \
+                base_url='/media/')
+
+        self.category = Category.create_category('Furniture')
+        self.user = User.create_user('seller', 'S', 'Eller', 'seller@mit.edu')
+        self.item = Item.create_item(self.user, 'Desk', 'wooden', self.category, '15.00', \
+                image=self.make_image('desk.jpg', (1200, 800)))
+
+    def tearDown(self):
+        self.image_field.storage = self.old_storage
+        shutil.rmtree(self.media_root)
+
+    def make_image(self, name, size):
+        data = StringIO()
+        Image.new('RGB', size, (255, 0, 0)).save(data, 'JPEG')
+        return SimpleUploadedFile(name, data.getvalue(), 'image/jpeg')
+
+    def open_variant(self, item, variant):
+        return Image.open(item.image.storage.open( \
+                thumbnails.variant_name(item.image.name, variant, item.thumbnails_version)))
+
+    def test_original_until_ready(self):
+        self.assertFalse(self.item.thumbnails_ready)
+        self.assertEqual(self.item.thumbnail_url, self.item.image.url)
+        self.assertEqual(Item.objects.get(id=self.item.id).medium_url, self.item.image.url)
+
+    def test_generate_thumbnails(self):
+        call_command('generate_thumbnails')
+
+        item = Item.get_item_by_id(self.item.id)
+        self.assertTrue(item.thumbnails_ready)
+        self.assertTrue(item.thumbnail_url.endswith('desk.thumb.jpg'))
+        self.assertTrue(item.medium_url.endswith('desk.medium.jpg'))
+        self.assertEqual(self.open_variant(item, 'thumb').size, (100, 66))
+        self.assertEqual(self.open_variant(item, 'medium').size, (600, 400))
+        self.assertEqual(list(Item.get_items_without_thumbnails(10)), [])
+
+    def test_backfill(self):
+        Item.make_thumbnails(self.item)
+        # a lost copy is rewritten by the backfill
+        self.item.image.storage.delete(thumbnails.variant_name(self.item.image.name, 'thumb'))
+        self.assertEqual(thumbnails.missing_variants(self.item.image), ['thumb'])
+
+        call_command('generate_thumbnails', all=True)
+        self.assertEqual(thumbnails.missing_variants(self.item.image), [])
+
+    def test_force_writes_new_names(self):
+        Item.make_thumbnails(self.item)
+        old_url = self.item.thumbnail_url
+        call_command('generate_thumbnails', all=True, force=True)
+
+        # browsers keep the old copies for a year, so the new ones get new urls
+        item = Item.get_item_by_id(self.item.id)
+        self.assertEqual(item.thumbnails_version, 1)
+        self.assertTrue(item.thumbnail_url.endswith('desk.thumb.v1.jpg'))
+        self.assertNotEqual(item.thumbnail_url, old_url)
+        self.assertEqual(self.open_variant(item, 'medium').size, (600, 400))
+        self.assertFalse(item.image.storage.exists( \
+                thumbnails.variant_name(item.image.name, 'thumb')))
+
+    def test_backfill_bumps_catalog_once_per_batch(self):
+        for name in ['chair.jpg', 'lamp.jpg']:
+            Item.create_item(self.user, 'Desk', 'desk', self.category, '5.00', \
+                    image=self.make_image(name, (300, 200)))
+        version = catalog_version.get()
+        call_command('generate_thumbnails', all=True, batch_size=2)
+        self.assertEqual(catalog_version.get(), version + 2)
+        self.assertEqual(list(Item.get_items_without_thumbnails(10)), [])
+
+    def test_corrupt_image(self):
+        broken = Item.create_item(self.user, 'Lamp', 'broken photo', self.category, '5.00', \
+                image=SimpleUploadedFile('lamp.jpg', 'not a jpeg', 'image/jpeg'))
+        stderr = StringIO()
+        call_command('generate_thumbnails', stderr=stderr)
+        self.assertTrue('item %d' % broken.id in stderr.getvalue())
+
+        # it isn't retried on the next pass
+        broken = Item.get_item_by_id(broken.id)
+        self.assertTrue(broken.thumbnails_failed)
+        self.assertFalse(broken.thumbnails_ready)
+        self.assertEqual(broken.thumbnail_url, broken.image.url)
+        self.assertEqual(list(Item.get_items_without_thumbnails(10)), [])
+
+    def test_items_without_images(self):
+        plain = Item.create_item(self.user, 'Chair', 'no photo', self.category, '5.00')
+        self.assertEqual(plain.thumbnail_url, None)
+        self.assertEqual(list(Item.get_items_without_thumbnails(10)), [self.item])
+
+class MediaTest(TestCase):
+    CONTENT = ''.join(chr(i % 256) for i in range(200000))
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.media_root, 'images'))
+        with open(os.path.join(self.media_root, 'images', 'desk.jpg'), 'wb') as f:
+            f.write(self.CONTENT)
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def get(self, path='images/desk.jpg', **headers):
+        return serve_media(self.factory.get('/media/' + path, **headers), path, \
+                self.media_root)
+
+    def test_serve(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Content-Length'], str(len(self.CONTENT)))
+        self.assertTrue(response['Cache-Control'].startswith('public, max-age='))
+        self.assertEqual(''.join(response), self.CONTENT)
+
+    def test_conditional_get(self):
+        response = self.get()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        for header in ['"other",%s', '"other" ,  %s', '%s,"other"']:
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=header % response['ETag']) \
+                    .status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"a", *').status_code, 304)
+        self.assertEqual(self.get( \
+                HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_ranges(self):
+        response = self.get(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/%d' % len(self.CONTENT))
+        self.assertEqual(''.join(response), self.CONTENT[100:200])
+
+        response = self.get(HTTP_RANGE='bytes=-10')
+        self.assertEqual(''.join(response), self.CONTENT[-10:])
+
+        response = self.get(HTTP_RANGE='bytes=199990-')
+        self.assertEqual(''.join(response), self.CONTENT[199990:])
+
+        self.assertEqual(self.get(HTTP_RANGE='bytes=300000-').status_code, 416)
+        # a stale If-Range gets the whole file
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', \
+                HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_missing_and_outside(self):
+        self.assertRaises(Http404, self.get, 'images/missing.jpg')
+        self.assertRaises(Http404, self.get, '../etc/passwd')
+        self.assertRaises(Http404, self.get, 'images')
+
+    def test_front_end_modes(self):
+        with override_settings(MEDIA_SERVE_MODE='x-sendfile'):
+            response = self.get()
+            self.assertEqual(response['X-Sendfile'], \
+                    os.path.join(self.media_root, 'images', 'desk.jpg'))
+            self.assertEqual(response.content, '')
+        with override_settings(MEDIA_SERVE_MODE='x-accel-redirect', \
+                MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/'):
+            response = self.get()
+            self.assertEqual(response['X-Accel-Redirect'], '/protected-media/images/desk.jpg')
+            self.assertTrue('ETag' in response)
+
+class ViewQueryTest(QueryBudgetMixin, TestCase):
+    ''' the number of queries a page runs must not grow with the number of rows '''
+    ROWS = 20
+
+    def setUp(self):
+        self.location = Location.create_location('Maseeh Hall', '42.35764', '-71.09338')
+        # get_current_user always returns pwh
+        self.user = User.create_user('pwh', 'Paul', 'Hemberger', 'pwh@mit.edu', \
+                '(234)567-8901', self.location)
+        self.category = Category.create_category('Textbooks')
+        for i in range(self.ROWS):
+            seller = User.create_user('seller%d' % i, 'S', str(i), 'seller%d@mit.edu' % i, \
+                    None, Location.create_location('Dorm %d' % i, '42.35', '-71.09'))
+            item = Item.create_item(seller, 'Textbook %d' % i, 'used', self.category, '10.00')
+            if i % 2:
+                Claim.create_claim(self.user, item)
+            self.user.add_reservation('Textbook %d' % i, '20.00')
+        self.client = Client()
+
+    def test_buy_page(self):
+        with self.assertMaxQueries(4):
+            response = self.client.get('/buy')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Dorm 0')
+
+        # the categories, locations and rendered listings come from the
+        # cache once it is warm; only the current user is looked up
+        with self.assertMaxQueries(1):
+            self.client.get('/buy')
+
+    def test_buy_page_search(self):
+        with self.assertMaxQueries(4):
+            response = self.client.get('/buy', {'search_query': 'textbook'})
+        self.assertContains(response, 'Dorm 0')
+
+    def test_buy_page_near(self):
+        with self.assertMaxQueries(6):
+            response = self.client.get('/buy', {'near': self.location.id, 'radius': '1000'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'm away')
+
+    def test_buy_page_near_bad_params(self):
+        # locations are picked by id, so duplicate names don't matter
+        Location.create_location('Maseeh Hall', '42.36', '-71.10')
+        for params in [{'near': '12345'}, {'near': 'Maseeh Hall'}, {'near': ''}]:
+            response = self.client.get('/buy', params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotContains(response, 'm away')
+
+        for radius in ['nan', 'inf', '-5', 'far']:
+            response = self.client.get('/buy', {'near': self.location.id, 'radius': radius})
+            self.assertContains(response, 'no listings within 500 m of Maseeh Hall')
+
+    def test_dashboard_page(self):
+        # with the sidebar categories cached: the current user, then the
+        # reservations, claims and listings
+        Category.get_cached_categories()
+        with self.assertMaxQueries(4):
+            response = self.client.get('/dashboard')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'seller1@mit.edu')
+        self.assertContains(response, 'Dorm 1')
+
+    def test_sell_page(self):
+        # with the sidebar categories cached: the current user, the
+        # category choices and the reservations
+        Category.get_cached_categories()
+        with self.assertMaxQueries(3):
+            response = self.client.get('/sell')
+        self.assertEqual(response.status_code, 200)
+
+    def test_current_user_lookup(self):
+        request = HttpRequest()
+        CurrentUserMiddleware().process_request(request)
+        # nothing is fetched until the user is needed
+        with self.assertMaxQueries(0):
+            CurrentUserMiddleware().process_request(request)
+        with self.assertMaxQueries(1):
+            self.assertEqual(request.current_user.username, 'pwh')
+            self.assertEqual(request.current_user.location, self.location)
+            self.assertEqual(get_current_user(request), self.user)
+
+class DashboardTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.create_user('pwh', 'Paul', 'Hemberger', 'pwh@mit.edu')
+        # a seller without a location
+        self.seller = User.create_user('kxing', 'Kerry', 'Xing', 'kxing@mit.edu')
+        self.category = Category.create_category('Furniture')
+
+    def test_load_dashboard(self):
+        chair = Item.create_item(self.seller, 'Wooden Chair', 'Slightly worn.', \
+                self.category, '24.97', image='images/chair.jpg')
+        Item.objects.filter(id=chair.id).update(thumbnails_ready=True)
+        Claim.create_claim(self.user, chair)
+        self.user.add_reservation('couch', '50.00')
+        lamp = Item.create_item(self.user, 'Lamp', 'Bright.', self.category, '5.00')
+
+        with self.assertMaxQueries(3):
+            dashboard = load_dashboard(self.user)
+
+        self.assertEqual([(r.search_query, r.max_price) for r in dashboard.reservations], \
+                [('couch', Decimal('50.00'))])
+        claim, = dashboard.claims
+        self.assertEqual((claim.item_id, claim.name, claim.price, claim.location, \
+                claim.seller_email), (chair.id, 'Wooden Chair', Decimal('24.97'), None, \
+                'kxing@mit.edu'))
+        self.assertEqual(claim.thumbnail_url, Item.get_item_by_id(chair.id).thumbnail_url)
+        self.assertNotEqual(claim.thumbnail_url, claim.medium_url)
+        item, = dashboard.items
+        self.assertEqual((item.id, item.name, item.thumbnail_url), (lamp.id, 'Lamp', None))
+
+        self.assertRaises(AttributeError, setattr, item, 'name', 'Desk')
+
+    def test_empty(self):
+        dashboard = load_dashboard(self.user)
+        self.assertEqual(dashboard, ((), (), ()))
+        response = self.client.get('/dashboard')
+        self.assertContains(response, 'You have no items to pick up.')
+        self.assertContains(response, 'You have no items for sale.')
+
+class ListingsCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.create_user('pwh', 'Paul', 'Hemberger', 'pwh@mit.edu')
+        self.seller = User.create_user('kxing', 'Kerry', 'Xing', 'kxing@mit.edu')
+        self.category = Category.create_category('Furniture')
+        self.item = Item.create_item(self.seller, 'Wooden Chair', 'Slightly worn.', \
+                self.category, '24.97')
+        self.client = Client()
+
+    def test_cached_until_catalog_changes(self):
+        misses = listings_cache.misses
+        self.assertContains(self.client.get('/buy'), 'Wooden Chair')
+        self.assertContains(self.client.get('/buy'), 'Wooden Chair')
+        self.assertEqual(listings_cache.misses, misses + 1)
+
+        couch = self.seller.add_item('Couch', 'Very comfortable.', self.category, '99.99')
+        self.assertContains(self.client.get('/buy'), 'Couch')
+        self.seller.remove_item(couch)
+        self.assertNotContains(self.client.get('/buy'), 'Couch')
+
+    @override_settings(SINGLE_PROCESS=False)
+    def test_not_cached_in_a_process_local_cache(self):
+        # other processes would never hear about a bump
+        misses = listings_cache.misses
+        self.assertContains(self.client.get('/buy'), 'Wooden Chair')
+        self.assertContains(self.client.get('/buy'), 'Wooden Chair')
+        self.assertEqual(listings_cache.misses, misses + 2)
+
+    def test_claimed_items_are_never_shown(self):
+        queries = [{}, {'category': 'Furniture'}, {'search_query': 'chair'}, \
+                {'id': self.item.id}]
+        for query in queries:
+            self.assertContains(self.client.get('/buy', query), 'Wooden Chair')
+            self.assertContains(self.client.get('/buy/more', query), 'Wooden Chair')
+
+        self.client.post('/claim', {'item_id': self.item.id})
+        for query in queries:
+            self.assertNotContains(self.client.get('/buy', query), 'Wooden Chair')
+            self.assertNotContains(self.client.get('/buy/more', query), 'Wooden Chair')
+
+        self.user.remove_claim(self.item)
+        self.assertContains(self.client.get('/buy'), 'Wooden Chair')
+
+    def test_csrf_token_is_per_request(self):
+        for client in [Client(), Client()]:
+            response = client.get('/buy')
+            self.assertNotContains(response, CSRF_PLACEHOLDER)
+            self.assertContains(response, "value='%s'" % response.cookies['csrftoken'].value)
+
+class ApiTest(QueryBudgetMixin, TestCase):
+    ROWS = 25
+
+    def setUp(self):
+        self.seller = User.create_user('kxing', 'Kerry', 'Xing', 'kxing@mit.edu', '(123)456-7890')
+        self.category = Category.create_category('Furniture')
+        self.items = [Item.create_item(self.seller, 'Chair %d' % i, 'Slightly worn.', \
+                self.category, '24.97') for i in range(self.ROWS)]
+        self.client = Client()
+
+    def get(self, path, params={}, status=200, **extra):
+        response = self.client.get('/api/v1/' + path, dict(params, format='json'), **extra)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_offset_pages(self):
+        data = json.loads(self.get('item/', {'limit': 10, 'offset': 20}).content)
+        self.assertEqual(data['meta']['total_count'], self.ROWS)
+        self.assertEqual([item['name'] for item in data['objects']], \
+                ['Chair %d' % i for i in range(4, -1, -1)])
+        self.assertEqual(data['meta']['next'], None)
+
+    def test_cursor_pages(self):
+        names = []
+        data = json.loads(self.get('item/', {'limit': 10}).content)
+        names.extend(item['name'] for item in data['objects'])
+        while data['meta']['next_cursor']:
+            after = int(data['meta']['next_cursor'].split('after=')[1].split('&')[0])
+            with self.assertMaxQueries(1):
+                data = json.loads(self.get('item/', {'limit': 10, 'after': after}).content)
+            self.assertNotIn('total_count', data['meta'])
+            names.extend(item['name'] for item in data['objects'])
+        self.assertEqual(names, ['Chair %d' % i for i in range(self.ROWS - 1, -1, -1)])
+        self.get('item/', {'after': 'x'}, status=400)
+
+    def test_sparse_fields_and_expand(self):
+        data = json.loads(self.get('item/%d/' % self.items[0].id, \
+                {'fields': 'name,price,seller_user'}).content)
+        self.assertEqual(sorted(data.keys()), ['name', 'price', 'resource_uri', 'seller_user'])
+        self.assertEqual(data['seller_user'], '/api/v1/user/%d/' % self.seller.id)
+
+        with self.assertMaxQueries(2):
+            data = json.loads(self.get('item/', {'expand': 'seller_user,category'}).content)
+        seller = data['objects'][0]['seller_user']
+        self.assertEqual(seller['username'], 'kxing')
+        self.assertNotIn('email', seller)
+        self.assertNotIn('cell_phone', seller)
+        self.assertEqual(data['objects'][0]['category']['name'], 'Furniture')
+
+    def test_category_links_to_items(self):
+        data = json.loads(self.get('category/%d/' % self.category.id).content)
+        self.assertEqual(data['items'], '/api/v1/item/?category=%d' % self.category.id)
+        data = json.loads(self.get('item/', {'category': self.category.id, 'limit': 1}).content)
+        self.assertEqual(data['meta']['total_count'], self.ROWS)
+
+    def test_conditional_get(self):
+        etag = self.get('item/')['ETag']
+        response = self.get('item/', status=304, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.content, '')
+        self.assertEqual(response['ETag'], etag)
+
+        Claim.create_claim(self.seller, self.items[-1])
+        self.assertNotEqual(self.get('item/', HTTP_IF_NONE_MATCH=etag)['ETag'], etag)
+
+    def test_read_only(self):
+        response = self.client.post('/api/v1/item/', '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 405)
+
+    def test_private_rows(self):
+        # no current user (get_current_user finds no 'pwh')
+        self.get('claim/', status=401)
+        self.get('filter/', status=401)
+
+        buyer = User.create_user('pwh', 'Paul', 'Hemberger', 'pwh@mit.edu')
+        mine = Claim.create_claim(buyer, self.items[0])
+        theirs = Claim.create_claim(self.seller, self.items[1])
+        reservation = buyer.add_reservation('chair', '30')
+        self.seller.add_reservation('couch', '50')
+        claims = json.loads(self.get('claim/').content)['objects']
+        self.assertEqual([claim['id'] for claim in claims], [mine.id])
+        self.get('claim/%d/' % theirs.id, status=401)
+        filters = json.loads(self.get('filter/').content)['objects']
+        self.assertEqual([row['id'] for row in filters], [reservation.id])
+
+class ExportTest(QueryBudgetMixin, TestCase):
+    ROWS = 25
+
+    def setUp(self):
+        self.seller = User.create_user('kxing', 'Kerry', 'Xing', 'kxing@mit.edu')
+        self.buyer = User.create_user('pwh', 'Paul', 'Hemberger', 'pwh@mit.edu')
+        self.furniture = Category.create_category('Furniture')
+        self.books = Category.create_category('Books')
+        for i in range(self.ROWS):
+            item = Item.create_item(self.seller, u'Caf\xe9 Chair %d' % i, 'Slightly worn.', \
+                    self.furniture if i % 5 else self.books, '24.97')
+            item.upload_time = datetime(2012, 5, 1 + i)
+            item.save()
+            if i % 2:
+                Claim.create_claim(self.buyer, item)
+        self.buyer.add_reservation('chair', '20.00')
+
+    def test_items_csv(self):
+        rows = list(csv.reader(StringIO(''.join(export('items', 'csv')))))
+        self.assertEqual(rows[0], ['id', 'name', 'description', 'category', 'seller', \
+                'price', 'claimed', 'upload_time'])
+        self.assertEqual(len(rows), self.ROWS + 1)
+        self.assertEqual(rows[1][1:], ['Caf\xc3\xa9 Chair 0', 'Slightly worn.', 'Books', \
+                'kxing', '24.97', 'False', '2012-05-01T00:00:00'])
+
+    def test_filters(self):
+        lines = list(export('items', 'ndjson', start=datetime(2012, 5, 5), \
+                end=datetime(2012, 5, 15), category=self.furniture))
+        names = [json.loads(line)['name'] for line in lines]
+        self.assertEqual(names, [u'Caf\xe9 Chair %d' % i for i in range(4, 14) if i % 5])
+
+        claims = [json.loads(line) for line in export('claims', 'ndjson', category=self.books)]
+        self.assertEqual([claim['item'] for claim in claims], \
+                [u'Caf\xe9 Chair 5', u'Caf\xe9 Chair 15'])
+        self.assertEqual(claims[0]['buyer'], 'pwh')
+
+        self.assertRaises(ExportError, export, 'reservations', 'csv', category=self.books)
+        self.assertRaises(ExportError, export, 'users', 'csv')
+        self.assertRaises(ExportError, export, 'items', 'xml')
+
+    def test_reads_in_batches(self):
+        # nothing is read until the export is consumed
+        with self.assertMaxQueries(0):
+            rows = get_rows('items', batch_size=10)
+        # three batches and the empty read that ends them
+        with self.assertMaxQueries(4):
+            self.assertEqual(len(list(rows)), self.ROWS)
+
+    def test_view(self):
+        client = Client()
+        response = client.get('/export/items.csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Chair')
+
+        AuthUser.objects.create_superuser('admin', 'admin@mit.edu', 'secret')
+        client.login(username='admin', password='secret')
+        response = client.get('/export/reservations.ndjson', {'start': '2000-01-01'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(json.loads(response.content)['search_query'], 'chair')
+        self.assertEqual(client.get('/export/items.csv', {'start': 'soon'}).status_code, 400)
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'items.csv')
+            call_command('export_data', 'items', output=path, start='2012-05-10')
+            with open(path, 'rb') as f:
+                rows = list(csv.reader(f))
+            self.assertEqual(len(rows), 1 + self.ROWS - 9)
+        finally:
+            shutil.rmtree(directory)
+
+class TypeaheadTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.create_user('kxing', 'Kerry', 'Xing', 'kxing@mit.edu')
+        self.buyer = User.create_user('pwh', 'Paul', 'Hemberger', 'pwh@mit.edu')
+        self.furniture = Category.create_category('Furniture')
+        self.chair = Item.create_item(self.seller, 'Wooden Chair', 'Slightly worn.', \
+                self.furniture, '24.97')
+        self.poster = Item.create_item(self.seller, 'Santorum Poster', '', \
+                self.furniture, '0.01')
+
+    def test_prefix_index(self):
+        index = PrefixIndex(['Wooden Chair', 'Chair', 'wooden  CHAIR', '3.091 Textbook'])
+        self.assertEqual(index.search('ch', 10), ['Chair', 'Wooden Chair'])
+        self.assertEqual(index.search('WOOD', 10), ['Wooden Chair'])
+        self.assertEqual(index.search('3.0', 10), ['3.091 Textbook'])
+        self.assertEqual(index.search('ch', 1), ['Chair'])
+        self.assertEqual(index.search('', 10), [])
+        # the name was added twice, so it stays until both are gone
+        index.remove('Wooden Chair')
+        self.assertEqual(index.search('wooden', 10), ['Wooden Chair'])
+        index.remove('wooden chair')
+        self.assertEqual(index.search('wooden', 10), [])
+        self.assertEqual(index.search('ch', 10), ['Chair'])
+
+    def test_follows_listings(self):
+        self.assertEqual(Item.suggest('cha'), [('item', 'Wooden Chair')])
+        self.assertEqual(Item.suggest('f'), [('category', 'Furniture')])
+        rebuilds = suggestions.rebuilds
+
+        # this process's own changes are applied without a reload
+        self.buyer.add_claim(self.chair)
+        self.assertEqual(Item.suggest('cha'), [])
+        self.buyer.remove_claim(self.chair)
+        self.assertEqual(Item.suggest('cha'), [('item', 'Wooden Chair')])
+        couch = self.seller.add_item('Couch', 'Very comfortable.', self.furniture, '99.99')
+        self.assertEqual(Item.suggest('c'), [('item', 'Wooden Chair'), ('item', 'Couch')])
+        Item.delete_item(couch)
+        self.assertEqual(Item.suggest('c'), [('item', 'Wooden Chair')])
+        self.assertEqual(suggestions.rebuilds, rebuilds)
+
+        # changes it didn't see cause a reload
+        Item.objects.filter(id=self.poster.id).update(name='Obama Poster')
+        catalog_version.bump()
+        self.assertEqual(Item.suggest('poster'), [('item', 'Obama Poster')])
+        self.assertEqual(suggestions.rebuilds, rebuilds + 1)
+
+    def test_cache_down(self):
+        # an unreachable memcached answers every get with None, as DummyCache does
+        cache_before, data_cache.cache = data_cache.cache, DummyCache('down', {})
+        try:
+            names = ['Wooden Chair']
+            typeahead = Typeahead(data_cache.CacheVersion('typeahead'), lambda: list(names), \
+                    lambda: [])
+            self.assertEqual(typeahead.suggest('cha'), [('item', 'Wooden Chair')])
+            names.append('Couch')
+            typeahead.changed(data_cache.CacheVersion('typeahead').bump(), added=['Couch'])
+            self.assertEqual(typeahead.suggest('cou'), [('item', 'Couch')])
+        finally:
+            data_cache.cache = cache_before
+
+    def test_view(self):
+        response = Client().get('/buy/suggest', {'q': 'Wood'})
+        self.assertEqual(json.loads(response.content), \
+                {'suggestions': [{'kind': 'item', 'text': 'Wooden Chair'}]})
+
+    def test_fast(self):
+        index = PrefixIndex(Benchmark().words(3) for i in range(5000))
+        prefixes = [word[:3] for word in ['textbook', 'chair', 'lamp', 'calculator', '8.01']]
+        start = time.time()
+        for i in range(1000):
+            index.search(prefixes[i % len(prefixes)], 10)
+        self.assertTrue((time.time() - start) / 1000 < 0.001)
+
+def query_plan(queryset):
+    '''
+    [(table, uses_index, sorts, step)] for each step the database takes to
+    run queryset, where sorts is whether the step sorts rows it has fetched
+    rather than reading them in index order
+    '''
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    if connection.vendor == 'sqlite':
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        steps = []
+        for row in cursor.fetchall():
+            detail = row[-1]
+            words = detail.split()
+            if 'TEMP B-TREE' in detail:
+                steps.append((None, False, 'ORDER BY' in detail, detail))
+                continue
+            table = words[2] if words[1] == 'TABLE' else words[1]
+            steps.append((table, 'INDEX' in detail or 'PRIMARY KEY' in detail, False, detail))
+        return steps
+    cursor.execute('EXPLAIN ' + sql, params)
+    columns = [column[0] for column in cursor.description]
+    return [(row[columns.index('table')], row[columns.index('type')] != 'ALL', \
+                    'filesort' in (row[columns.index('Extra')] or ''), row) \
+            for row in cursor.fetchall()]
+
+class QueryPlanTest(TransactionTestCase):
+    '''
+    the buy page and reservation matching must not fall back to full table
+    scans or sorting. sqlite commits before an EXPLAIN, so this can't be a
+    TestCase.
+    '''
+    def setUp(self):
+        self.seller = User.create_user('kxing', 'Kerry', 'Xing', 'kxing@mit.edu')
+        self.furniture = Category.create_category('Furniture')
+        for i in range(20):
+            item = Item.create_item(self.seller, 'Chair %d' % i, '', self.furniture, \
+                    '%d.00' % (i + 1))
+            if i % 2:
+                Claim.create_claim(self.seller, item)
+            Reservation.create_reservation(self.seller, 'Chair %d' % i, '%d.00' % (i + 1))
+
+    def assertUsesIndexes(self, queryset, tables, may_sort=False):
+        plan = query_plan(queryset)
+        steps = [step for step in plan if step[0] in tables]
+        self.assertTrue(steps)
+        for table, uses_index, sorts, step in steps:
+            self.assertTrue(uses_index, 'full scan of %s: %s' % (table, step))
+        if not may_sort:
+            for table, uses_index, sorts, step in plan:
+                self.assertFalse(sorts, 'sorted outside an index: %s' % (step,))
+
+    def test_listings(self):
+        after = (datetime.utcnow(), 10)
+        for queryset in [
+                Item.get_filtered_items(),
+                Item.get_filtered_items(after=after),
+                Item.get_filtered_items(category=self.furniture),
+                Item.get_filtered_items(category=self.furniture, after=after),
+                Item.get_filtered_items(min_price=Decimal('5'), max_price=Decimal('10'), \
+                        sort=Item.PRICE_LOW),
+                Item.get_filtered_items(sort=Item.PRICE_LOW),
+                Item.get_filtered_items(sort=Item.PRICE_HIGH, after=(Decimal('8'), 7)),
+                Item.get_filtered_items(category=self.furniture, sort=Item.PRICE_LOW, \
+                        min_price=Decimal('5'))]:
+            self.assertUsesIndexes(queryset, ['data_item'])
+
+        # no index gives both a price range and the newest first, so only
+        # the listings in the range are sorted
+        self.assertUsesIndexes(Item.get_filtered_items(min_price=Decimal('5'), \
+                max_price=Decimal('10')), ['data_item'], may_sort=True)
+
+    def test_reservation_matching(self):
+        # the query run for every new listing
+        self.assertUsesIndexes(ReservationKeyword.get_reservation_ids('Wooden chair', \
+                Decimal('10')), ['data_reservationkeyword'])
+
+class LogCapture(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.create_user('pwh', 'Paul', 'Hemberger', 'pwh@mit.edu')
+        self.seller = User.create_user('kxing', 'Kerry', 'Xing', 'kxing@mit.edu')
+        self.category = Category.create_category('Furniture')
+        Item.create_item(self.seller, 'Wooden Chair', 'Slightly worn.', self.category, '24.97')
+        # the profiles go to the capture alone, not to the console
+        self.log = LogCapture()
+        self.handlers_before = profiling.logger.handlers
+        profiling.logger.handlers = [self.log]
+
+    def tearDown(self):
+        profiling.logger.handlers = self.handlers_before
+        Template.render = profiling.template_render
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_off(self):
+        response = Client().get('/buy')
+        self.assertContains(response, 'Wooden Chair')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(self.log.messages, [])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_SLOW_QUERIES=2)
+    def test_sampled(self):
+        use_debug_cursor = connection.use_debug_cursor
+        response = Client().get('/buy')
+        self.assertContains(response, 'Wooden Chair')
+        self.assertEqual(connection.use_debug_cursor, use_debug_cursor)
+
+        timings = dict((timing.split(';')[0], timing) \
+                for timing in response['Server-Timing'].split(', '))
+        self.assertEqual(sorted(timings.keys()), ['db', 'total', 'tpl', 'view'])
+
+        self.assertEqual(len(self.log.messages), 1)
+        line = json.loads(self.log.messages[0])
+        self.assertEqual(line['path'], '/buy')
+        self.assertEqual(line['view'], 'buy_page')
+        self.assertTrue(line['queries'] > 0)
+        self.assertTrue('desc="%d queries"' % line['queries'] in timings['db'])
+        self.assertTrue(0 < len(line['slowest']) <= 2)
+        self.assertTrue(line['template_ms'] <= line['view_ms'] <= line['total_ms'])
+
+    def test_nested_templates_counted_once(self):
+        profile = profiling.RequestProfile(RequestFactory().get('/buy'))
+        profiling.install_template_timer()
+        profiling.current.profile = profile
+        try:
+            template = Template('{% for i in items %}{% include "buy/search_bar.html" %}{% endfor %}')
+            start = time.time()
+            template.render(Context({'items': range(3)}))
+            elapsed = time.time() - start
+        finally:
+            profiling.current.profile = None
+            profile.finish()
+        self.assertEqual(profile.template_depth, 0)
+        self.assertTrue(0 < profile.template_time <= elapsed)
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.create_user('pwh', 'Paul', 'Hemberger', 'pwh@mit.edu')
+        self.buyer = User.create_user('qwerty', 'Q', 'W', 'qwerty@mit.edu')
+        self.seller = User.create_user('kxing', 'Kerry', 'Xing', 'kxing@mit.edu')
+        self.category = Category.create_category('Furniture')
+
+    def test_render(self):
+        metrics = Registry()
+        requests = metrics.counter('requests_total', 'Requests.', labels=('method',))
+        requests.inc(method='GET')
+        requests.inc(2, method='POST')
+        metrics.gauge('queue_length', 'Queued jobs.').set_function(lambda: 7)
+        latency = metrics.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            latency.observe(value)
+
+        self.assertEqual(metrics.render().split('\n'), [
+            '# HELP latency_seconds Latency.',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{le="0.1"} 2',
+            'latency_seconds_bucket{le="1"} 3',
+            'latency_seconds_bucket{le="+Inf"} 4',
+            'latency_seconds_sum 3.65',
+            'latency_seconds_count 4',
+            '# HELP queue_length Queued jobs.',
+            '# TYPE queue_length gauge',
+            'queue_length 7',
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{method="GET"} 1',
+            'requests_total{method="POST"} 2',
+            '',
+        ])
+
+        # registering again returns the same metric, as another kind fails
+        self.assertTrue(metrics.counter('requests_total', 'Requests.', ('method',)) is requests)
+        self.assertRaises(ValueError, metrics.gauge, 'requests_total', 'Requests.')
+        self.assertRaises(ValueError, requests.inc, status='200')
+
+    def test_concurrent_updates(self):
+        counter = Registry().counter('hits_total', 'Hits.')
+        def work():
+            for i in range(1000):
+                counter.inc()
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.get(), 4000)
+
+    def test_instrumentation(self):
+        claims = registry.metrics['geddit_claims_total']
+        matches = registry.metrics['geddit_reservation_matches']
+        claimed, conflicts = claims.get(outcome='claimed'), claims.get(outcome='conflict')
+        items, matched = matches.get()
+
+        self.buyer.add_reservation('chair', '50.00')
+        item = self.seller.add_item('Wooden Chair', 'Slightly worn.', self.category, '24.97')
+        self.assertEqual(matches.get(), (items + 1, matched + 1))
+
+        Claim.create_claim(self.buyer, item)
+        self.assertRaises(AssertionError, Claim.create_claim, self.seller, item)
+        self.assertEqual(claims.get(outcome='claimed'), claimed + 1)
+        self.assertEqual(claims.get(outcome='conflict'), conflicts + 1)
+
+        listings = registry.metrics['geddit_buy_page_listings_seconds']
+        count = listings.get(keywords='2')[0]
+        self.client.get('/buy', {'search_query': 'wooden chair'})
+        self.assertEqual(listings.get(keywords='2')[0], count + 1)
+
+    def test_view(self):
+        self.client.get('/buy')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertContains(response, '# TYPE geddit_claims_total counter')
+        self.assertContains(response, 'geddit_cache_hit_ratio{cache="listings"}')
+
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+class DirectoryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = FakeDirectory()
+        self.directory.add('kxing', 'Kerry', 'Xing', 'kxing@mit.edu')
+        self.directory.add('pwh', 'Paul', 'Hemberger', 'pwh@mit.edu')
+        self.client_before = directory._directory
+        directory._directory = DirectoryClient(connect=self.directory.connect)
+        mit._groups.clear()
+
+    def tearDown(self):
+        directory._directory = self.client_before
+        mit._groups.clear()
+
+    def test_lookups_are_cached(self):
+        client = directory.get_directory()
+        self.assertEqual(client.lookup('kxing')['mail'], 'kxing@mit.edu')
+        self.assertEqual(client.lookup('kxing')['givenName'], 'Kerry')
+        self.assertEqual(client.lookup('nobody'), None)
+        self.assertEqual(client.lookup('nobody'), None)
+        self.assertEqual(self.directory.searches, ['(uid=kxing)', '(uid=nobody)'])
+
+    def test_lookup_many(self):
+        for i in range(120):
+            self.directory.add('user%d' % i, 'User', str(i), 'user%d@mit.edu' % i)
+        client = directory.get_directory()
+        usernames = ['user%d' % i for i in range(120)] + ['nobody']
+        entries = client.lookup_many(usernames)
+        self.assertEqual(len(entries), 120)
+        self.assertEqual(entries['user7']['sn'], '7')
+        self.assertEqual(len(self.directory.searches), 3)
+
+        client.lookup_many(usernames)
+        self.assertEqual(len(self.directory.searches), 3)
+
+    def test_connections_are_pooled(self):
+        client = directory.get_directory()
+        for username in ['kxing', 'pwh', 'nobody']:
+            client.lookup(username)
+        self.assertEqual(self.directory.connections, 1)
+
+        # an idle connection the server dropped is replaced
+        client.idle[0].open = False
+        self.assertEqual(client.lookup('someone'), None)
+        self.assertEqual(self.directory.connections, 2)
+
+        self.directory.down = True
+        self.assertRaises(IOError, client.lookup, 'someone else')
+
+    def test_configure_user(self):
+        mit_group = Group.objects.create(name='mit')
+        autocreated = Group.objects.create(name='autocreated')
+        backend = mit.ScriptsRemoteUserBackend()
+        user = backend.authenticate('kxing@MIT.EDU')
+        self.assertEqual((user.first_name, user.last_name, user.email), \
+                ('Kerry', 'Xing', 'kxing@mit.edu'))
+        self.assertEqual(set(user.groups.all()), set([mit_group, autocreated]))
+
+        # the groups are looked up once
+        with QueryBudget(self, 6):
+            user = backend.authenticate('pwh@MIT.EDU')
+        self.assertEqual(user.groups.count(), 2)
+        self.assertEqual(self.directory.searches, ['(uid=kxing)', '(uid=pwh)'])
+
+        self.assertRaises(ValueError, backend.authenticate, 'nobody@MIT.EDU')
+
+    def test_prefetch_command(self):
+        output = StringIO()
+        call_command('prefetch_directory', 'kxing', 'PWH@mit.edu', 'nobody', stdout=output)
+        self.assertEqual(output.getvalue(), \
+                'Found 2 of 3 usernames\nNot in the directory: nobody\n')
+        self.assertEqual(len(self.directory.searches), 1)
+        directory.get_directory().lookup('pwh')
+        self.assertEqual(len(self.directory.searches), 1)
+
+class ZephyrTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = os.path.join(self.directory, 'zwrite.log')
+        self.notifier_before = zwrite._notifier
+
+    def tearDown(self):
+        zwrite._notifier = self.notifier_before
+        shutil.rmtree(self.directory)
+
+    def stand_in(self, delay=0):
+        ''' a zwrite that logs its arguments and message '''
+        path = os.path.join(self.directory, 'zwrite')
+        with open(path, 'wb') as f:
+            f.write('#!/bin/sh\nsleep %s\n{ echo "$@"; cat; echo; echo ---; } >> %s\n' % \
+                    (delay, self.log))
+        os.chmod(path, 0755)
+        return path
+
+    def zephyrs(self):
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as f:
+            return [zephyr.strip('\n') for zephyr in f.read().split('---\n') if zephyr]
+
+    def test_bursts_are_coalesced(self):
+        notifier = ZephyrNotifier(self.stand_in(), linger=0.5)
+        for i in range(10):
+            notifier.send('line %d' % i)
+        notifier.send('oops', 'geddit', 'errors', 'kxing')
+        notifier.flush()
+        self.assertEqual(self.zephyrs(), [
+            '-d -n -c message -i log nobody\n' + '\n'.join('line %d' % i for i in range(10)),
+            '-d -n -c geddit -i errors kxing\noops',
+        ])
+        self.assertEqual(notifier.get_stats()['batches'], 2)
+        self.assertEqual(notifier.get_stats()['sent'], 11)
+        notifier.close()
+
+    def test_never_blocks(self):
+        notifier = ZephyrNotifier(self.stand_in(0.3), max_queue=2, batch_size=1, linger=0)
+        start = time.time()
+        results = [notifier.send('line %d' % i) for i in range(10)]
+        self.assertTrue(time.time() - start < 0.2)
+        self.assertTrue(False in results)
+        notifier.close()
+
+        stats = notifier.get_stats()
+        self.assertEqual(stats['dropped'], results.count(False))
+        self.assertEqual(stats['sent'], results.count(True))
+        self.assertEqual(len(self.zephyrs()), results.count(True))
+
+    def test_missing_zwrite(self):
+        notifier = ZephyrNotifier(os.path.join(self.directory, 'missing'), linger=0)
+        notifier.send('lost')
+        notifier.flush()
+        self.assertEqual(notifier.get_stats()['failed'], 1)
+        # the worker carries on
+        notifier.command = self.stand_in()
+        notifier.send('found')
+        notifier.close()
+        self.assertEqual(len(self.zephyrs()), 1)
+
+    def test_unicode(self):
+        notifier = ZephyrNotifier(self.stand_in(), linger=0)
+        notifier.send(u'caf\xe9')
+        # arguments zwrite can't be run with fail that zephyr, not the worker
+        notifier.send('lost', 'bad\0class')
+        notifier.close()
+        self.assertEqual(self.zephyrs(), ['-d -n -c message -i log nobody\ncaf\xc3\xa9'])
+        self.assertEqual(notifier.get_stats()['sent'], 1)
+        self.assertEqual(notifier.get_stats()['failed'], 1)
+
+    def test_zephyr(self):
+        zwrite._notifier = ZephyrNotifier(self.stand_in(), linger=0)
+        self.assertTrue(mit.zephyr('hello', rcpt='pwh'))
+        zwrite._notifier.close()
+        self.assertEqual(self.zephyrs(), ['-d -n -c message -i log pwh\nhello'])
+
+class BenchmarkTest(TestCase):
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(percentile([], 50), None)
+
+    def test_run(self):
+        version = catalog_version.get()
+        results = Benchmark(users=5, locations=2, categories=2, items=30, \
+                reservations=10, claims=5, iterations=2).run()
+        self.assertEqual(Item.objects.filter(claimed=True).count(), 5)
+        self.assertEqual(Claim.objects.count(), 5)
+        for name in ['buy_page', 'buy_page_cached', 'buy_page_search_3', 'add_item', \
+                'dashboard_page', 'claim_unclaim']:
+            self.assertEqual(results['results'][name]['count'], 2)
+            self.assertTrue(results['results'][name]['queries_max'] > 0)
+
+        # the run's catalog changes stayed in a namespace of its own
+        self.assertEqual(catalog_version.get(), version)
+
+        # comparing a run with itself finds nothing
+        self.assertEqual(compare(results, results, 0.1), [])
+
+class LoaderTest(TransactionTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_load_seed_data(self):
+        call_command('load_data', 'data/seed/initial_data.jsonl', stdout=StringIO())
+        self.assertEqual(Location.objects.count(), 12)
+        self.assertEqual(Category.objects.count(), 19)
+        self.assertEqual(User.objects.count(), 4)
+        self.assertEqual(Item.objects.count(), 8)
+        self.assertEqual(User.get_user('pwh').location.name, 'Maseeh Hall')
+        newest = Item.get_filtered_items()[0]
+        self.assertEqual(newest.name, 'DropBox T-shirt')
+        self.assertEqual(newest.upload_time, datetime(2012, 5, 1, 12, 0, 7))
+        self.assertEqual(newest.seller_user.username, 'kxing')
+        self.assertEqual(newest.category.name, 'Clothing and Accessories')
+        self.assertEqual(len(Item.get_filtered_items(search_query='textbook')), 2)
+        self.assertEqual(Notification.objects.count(), 0)
+        # the caches see rows that were inserted without signals
+        self.assertEqual(len(Category.get_cached_categories()), 19)
+
+    def test_load_csv(self):
+        Location.create_location('Baker Hall', '42.35666', '-71.09582')
+        Category.create_category('Books')
+        users = self.write('users.csv', 'username,first_name,last_name,email,location\n' \
+                'kxing,Kerry,Xing,kxing@mit.edu,Baker Hall\n')
+        items = self.write('listings.csv', 'seller,name,description,category,price\n' \
+                'kxing,Caf\xc3\xa9 Chair,Comfy,Books,12.50\n')
+        User.create_user('pwh', 'Paul', 'Hemberger', 'pwh@mit.edu').add_reservation('chair', '20')
+        loader = BulkLoader()
+        loader.read(users)
+        loader.read(items, 'item')
+        self.assertEqual(loader.load(), {'location': 0, 'category': 0, 'user': 1, 'item': 1})
+        item = Item.objects.get()
+        self.assertEqual(item.name, u'Caf\xe9 Chair')
+        self.assertEqual(item.seller_user.location.name, 'Baker Hall')
+        self.assertEqual([i.id for i in Item.get_filtered_items(search_query='chair')], [item.id])
+        # loaded items don't notify matching reservations
+        self.assertEqual(Notification.objects.count(), 0)
+
+    def test_errors_load_nothing(self):
+        path = self.write('seed.jsonl', '{"model": "category", "name": "Books"}\n' \
+                '{"model": "item", "seller": "nobody", "name": "Chair", "category": "Books", ' \
+                '"price": "1.00"}\n')
+        loader = BulkLoader()
+        loader.read(path)
+        self.assertRaises(LoadError, loader.load)
+        self.assertEqual(Category.objects.count(), 0)
+        self.assertRaises(LoadError, BulkLoader().read, self.write('stuff.csv', 'a\n1\n'))
+
+    def test_bad_rows_are_reported(self):
+        User.create_user('kxing', 'Kerry', 'Xing', 'kxing@mit.edu')
+        Category.create_category('Books')
+        for name, content, message in [
+                ('items.csv', 'seller,name,category,price\nkxing,Chair,Books,12.50\n' \
+                        'kxing,Desk,Books,cheap\n', 'items.csv:3: "cheap" is not a valid price'),
+                ('locations.csv', 'name,latitude,longitude\nBaker,42.35,north\n', \
+                        'locations.csv:2: "north" is not a valid longitude'),
+                ('users.csv', 'username,first_name,last_name,email\n' \
+                        'kxing,Kerry,Xing,kxing@mit.edu\n', \
+                        'users.csv:2: username "kxing" already exists'),
+                ('categories.jsonl', '{"name": "Chairs"}\n{"name": "Chairs"}\n', \
+                        'categories.jsonl:2: category "Chairs" already exists')]:
+            loader = BulkLoader()
+            loader.read(self.write(name, content), None if '.csv' in name else 'category')
+            try:
+                loader.load()
+            except LoadError, e:
+                self.assertTrue(str(e).endswith(message), str(e))
+            else:
+                self.fail('%s loaded' % name)
+        self.assertEqual(Item.objects.count(), 0)
+        self.assertEqual(Location.objects.count(), 0)
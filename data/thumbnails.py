@@ -0,0 +1,67 @@
+import os
+from cStringIO import StringIO
+
+from django.core.files.base import ContentFile
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+# name -> bounding box of the resized copies made of every item image
+VARIANTS = {
+    'thumb': (100, 100),
+    'medium': (600, 600),
+}
+
+def variant_name(name, variant, version=0):
+    '''
+    images/2012/04/01/desk.jpg -> images/2012/04/01/desk.thumb.jpg, or
+    desk.thumb.v2.jpg for version 2. Copies are served with a long max-age,
+    so regenerated copies get a new version rather than replacing a file.
+    '''
+    root, ext = os.path.splitext(name)
+    if version:
+        return '%s.%s.v%d%s' % (root, variant, version, ext)
+    return '%s.%s%s' % (root, variant, ext)
+
+def missing_variants(field_file, version=0):
+    return [variant for variant in VARIANTS \
+            if not field_file.storage.exists(variant_name(field_file.name, variant, version))]
+
+def generate_variants(field_file, variants=None, version=0):
+    '''
+    writes the resized copies of an item image next to the original, in the
+    same format. Images already smaller than a variant are copied as is.
+    Raises IOError if the image can't be read.
+    '''
+    if variants is None:
+        variants = VARIANTS.keys()
+    source = field_file.storage.open(field_file.name)
+    try:
+        try:
+            original = Image.open(source)
+            original.load()
+        except (SyntaxError, ValueError, IndexError), e:
+            # PIL reports some truncated or corrupt files this way
+            raise IOError('cannot read image: %s' % e)
+    finally:
+        source.close()
+    image_format = original.format or 'JPEG'
+    if image_format == 'JPEG' and original.mode not in ('RGB', 'L'):
+        original = original.convert('RGB')
+
+    for variant in variants:
+        image = original.copy()
+        image.thumbnail(VARIANTS[variant], Image.ANTIALIAS)
+        data = StringIO()
+        image.save(data, image_format)
+        name = variant_name(field_file.name, variant, version)
+        if field_file.storage.exists(name):
+            field_file.storage.delete(name)
+        field_file.storage.save(name, ContentFile(data.getvalue()))
+
+def delete_variants(field_file, version):
+    for variant in VARIANTS:
+        name = variant_name(field_file.name, variant, version)
+        if field_file.storage.exists(name):
+            field_file.storage.delete(name)
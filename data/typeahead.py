@@ -0,0 +1,128 @@
+import bisect
+import threading
+
+from data.search import normalize
+
+class PrefixIndex(object):
+    '''
+    sorted array of normalized names, searched by prefix with bisect.
+
+    A name is filed under every word it contains, so "chair" finds
+    "Wooden Chair". Names are counted, so removing one of two listings with
+    the same name keeps the suggestion.
+    '''
+    def __init__(self, names=()):
+        self.keys = []
+        self.names = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        normalized = normalize(name)
+        if not normalized:
+            return
+        entry = self.names.get(normalized, None)
+        if entry is not None:
+            entry[1] += 1
+            return
+        self.names[normalized] = [name, 1]
+        words = normalized.split(' ')
+        for i in range(len(words)):
+            bisect.insort(self.keys, (u' '.join(words[i:]), normalized))
+
+    def remove(self, name):
+        normalized = normalize(name)
+        entry = self.names.get(normalized, None)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del self.names[normalized]
+        words = normalized.split(' ')
+        for i in range(len(words)):
+            key = (u' '.join(words[i:]), normalized)
+            index = bisect.bisect_left(self.keys, key)
+            if index < len(self.keys) and self.keys[index] == key:
+                del self.keys[index]
+
+    def search(self, prefix, limit):
+        ''' up to limit names with a word starting with prefix, in alphabetical order of the match '''
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        index = bisect.bisect_left(self.keys, (prefix,))
+        while index < len(self.keys) and len(results) < limit:
+            key, normalized = self.keys[index]
+            if not key.startswith(prefix):
+                break
+            if normalized not in seen:
+                seen.add(normalized)
+                results.append(self.names[normalized][0])
+            index += 1
+        return results
+
+class Typeahead(object):
+    '''
+    per-process suggestions for the search bar from the names of unclaimed
+    items and of the categories.
+
+    The item index follows a CacheVersion. Changes made by this process are
+    applied to the index as they happen through changed(); when anything
+    else moves the version the index is reloaded on the next search.
+    '''
+    def __init__(self, cache_version, load_items, load_categories):
+        self.cache_version = cache_version
+        self.load_items = load_items
+        self.load_categories = load_categories
+        self.lock = threading.Lock()
+        self.version = None
+        self.items = None
+        self.categories_source = None
+        self.categories = None
+        self.rebuilds = 0
+
+    def changed(self, version, added=(), removed=()):
+        '''
+        records the names that a bump to version added and removed. If the
+        index missed an earlier bump it is left to be reloaded instead.
+        '''
+        with self.lock:
+            if self.version is None or version != self.version + 1:
+                return
+            for name in added:
+                self.items.add(name)
+            for name in removed:
+                self.items.remove(name)
+            self.version = version
+
+    def get_indexes(self):
+        version = self.cache_version.get()
+        with self.lock:
+            # without a version (the cache is down) the index is never reused
+            items = self.items if version is not None and version == self.version else None
+        if items is None:
+            items = PrefixIndex(self.load_items())
+            with self.lock:
+                self.items = items
+                self.version = version
+                self.rebuilds += 1
+
+        categories = self.load_categories()
+        with self.lock:
+            # the category cache hands out the same list until it reloads
+            if categories is not self.categories_source:
+                self.categories = PrefixIndex(category.name for category in categories)
+                self.categories_source = categories
+            return items, self.categories
+
+    def suggest(self, prefix, limit=10):
+        ''' [(kind, name)] for categories, then items, with a word starting with prefix '''
+        items, categories = self.get_indexes()
+        with self.lock:
+            suggestions = [('category', name) for name in categories.search(prefix, limit)]
+            suggestions.extend(('item', name) \
+                    for name in items.search(prefix, limit - len(suggestions)))
+        return suggestions
@@ -1,7 +1,10 @@
 # Create your views here.
 from django.http import HttpResponse, HttpResponseRedirect, QueryDict
 from django.template import Context, loader, RequestContext
-from data.models import Category, Item, User, Reservation
+from django.template.loader import render_to_string
+from django.middleware.csrf import get_token
+from data.models import catalog_version, Category, Item, User, Reservation, Location, \
+        Notification
 from data.forms import ItemForm, UserSettingsForm, ReservationForm
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_protect, csrf_exempt
@@ -10,9 +13,16 @@ from django.contrib.auth.decorators import login_required
 from django.utils import simplejson
 from django.core.urlresolvers import reverse
 
-from data.views_lib import base_params
+from data.cache import FragmentCache
+from data.dashboard import load_dashboard
+from data.metrics import registry, hit_ratio, timed
+from data.search import tokenize
+from data.views_lib import base_params, encode_cursor, decode_cursor
+from site_specific_constants import SITE_ROOT
 
+import math
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
 
 NAV_PAGE = 'nav_page'
 BUY = 'buy'
@@ -20,25 +30,185 @@ SELL = 'sell'
 DASHBOARD = 'dashboard'
 SETTINGS = 'settings'
 
-def buy_page(request):
-    render_params = base_params(request)
-    render_params[NAV_PAGE] = BUY
+# proximity search radii, in meters
+RADIUS_CHOICES = (250, 500, 1000, 2000)
+DEFAULT_RADIUS = 500
+MAX_RADIUS = 10000
+
+SORT_CHOICES = (
+    (Item.NEWEST, 'Newest first'),
+    (Item.PRICE_LOW, 'Price: low to high'),
+    (Item.PRICE_HIGH, 'Price: high to low'),
+)
+
+# search bar suggestions per request
+SUGGESTION_LIMIT = 10
+
+# the query parameters that decide what the listings table shows
+LISTING_FILTERS = ('category', 'search_query', 'id', 'after', 'near', 'radius', \
+        'min_price', 'max_price', 'sort')
+
+# rendered listings are shared between users, so each response gets its
+# own CSRF token swapped in for this
+CSRF_PLACEHOLDER = 'GEDDIT-CSRF-TOKEN'
+
+# rendered listings tables, dropped whenever catalog_version is bumped
+listings_cache = FragmentCache('listings', catalog_version, timeout=300)
+
+# search latency is broken down by keyword count, capped at this
+MAX_KEYWORDS_LABEL = 4
 
+buy_page_seconds = registry.histogram('geddit_buy_page_listings_seconds', \
+        'Time taken to get the buy page listings, by search keyword count.', \
+        labels=('keywords',))
+registry.gauge('geddit_cache_hit_ratio', \
+        'Share of lookups answered by a cache in this process.', labels=('cache',)) \
+        .set_function(hit_ratio(listings_cache.get_stats), cache='listings')
+
+def keywords_label(request):
+    count = len(tokenize(request.GET.get('search_query', '')))
+    if count >= MAX_KEYWORDS_LABEL:
+        return '%d+' % MAX_KEYWORDS_LABEL
+    return str(count)
+
+def listing_filters(request):
+    ''' the listing filters of the request, in a fixed order '''
+    filters = QueryDict('', mutable=True)
+    for name in LISTING_FILTERS:
+        if request.GET.get(name, None):
+            filters[name] = request.GET[name]
+    return filters
+
+def proximity_params(request):
+    '''
+    the location and radius of a proximity search, or None and the default
+    radius. near is a location id; unknown ids search anywhere.
+    '''
+    near = None
+    radius = DEFAULT_RADIUS
+    try:
+        near_id = int(request.GET.get('near', ''))
+    except ValueError:
+        return near, radius
+    # the cached list also fills the location select, so this costs no query
+    for location in Location.get_cached_locations():
+        if location.id == near_id:
+            near = location
+    if near is None:
+        return near, radius
+    try:
+        radius = float(request.GET.get('radius', DEFAULT_RADIUS))
+    except ValueError:
+        pass
+    if math.isnan(radius) or math.isinf(radius) or radius <= 0:
+        radius = DEFAULT_RADIUS
+    return near, min(radius, MAX_RADIUS)
+
+def price_params(request):
+    ''' the price range and sort order asked for, ignoring ones that don't parse '''
+    prices = []
+    for name in ('min_price', 'max_price'):
+        try:
+            prices.append(Decimal(request.GET[name]))
+        except (KeyError, InvalidOperation):
+            prices.append(None)
+    sort = request.GET.get('sort', Item.NEWEST)
+    if sort not in Item.SORT_ORDERS:
+        sort = Item.NEWEST
+    return prices[0], prices[1], sort
+
+def listing_params(request):
+    ''' the items and filters shown by the listings table '''
     category = None
     if 'category' in request.GET:
         category = Category.get_category(request.GET['category'])
 
     search_query = request.GET.get('search_query', None)
     id = request.GET.get('id', None)
+    min_price, max_price, sort = price_params(request)
+    after = None
+    if 'after' in request.GET:
+        after = decode_cursor(request.GET['after'], sort)
+
+    near, radius = proximity_params(request)
+
+    if near is not None:
+        # sorted by distance, so only the closest page is shown
+        items = Item.get_items_near(near, radius, category, search_query, \
+                min_price=min_price, max_price=max_price)
+        next_cursor = None
+    else:
+        items, next_cursor = Item.get_item_page(category, search_query, id, after, \
+                min_price=min_price, max_price=max_price, sort=sort)
 
-    render_params['items'] = Item.get_filtered_items(category, search_query, id)
-    render_params['category'] = category
-    render_params['search_query'] = search_query
-    render_params['id'] = id
+    params = {
+        'SITE_ROOT': SITE_ROOT,
+        'items': items,
+        'category': category,
+        'search_query': search_query,
+        'id': id,
+        'near': near,
+        'radius': radius,
+        'min_price': min_price,
+        'max_price': max_price,
+        'sort': sort,
+        'next_cursor': None,
+    }
+    if next_cursor is not None:
+        get_params = listing_filters(request)
+        get_params['after'] = encode_cursor(next_cursor)
+        params['next_cursor'] = get_params['after']
+        params['next_page_query'] = get_params.urlencode()
+    return params
+
+def cached_listings(request, template):
+    '''
+    renders template with listing_params, reusing the copy rendered for
+    the same filters until the catalog changes. Returns the HTML and the
+    cursor of the next page.
+    '''
+    def render_listings():
+        params = listing_params(request)
+        html = render_to_string(template, params, \
+                context_instance=Context({'csrf_token': CSRF_PLACEHOLDER}))
+        return {
+            'html': html,
+            'next': params['next_cursor'],
+            'next_page_query': params.get('next_page_query', None),
+        }
+
+    key = template + '?' + listing_filters(request).urlencode()
+    listings = listings_cache.get(key, render_listings)
+    listings['html'] = listings['html'].replace(CSRF_PLACEHOLDER, get_token(request))
+    return listings
+
+def buy_page(request):
+    render_params = base_params(request)
+    render_params[NAV_PAGE] = BUY
+    render_params['near'], render_params['radius'] = proximity_params(request)
+    render_params['min_price'], render_params['max_price'], render_params['sort'] = \
+            price_params(request)
+    render_params['sort_choices'] = SORT_CHOICES
+    with timed(buy_page_seconds, keywords=keywords_label(request)):
+        render_params['listings'] = cached_listings(request, 'buy/listings_table.html')['html']
+    render_params['locations'] = Location.get_cached_locations()
+    render_params['radius_choices'] = RADIUS_CHOICES
 
     return render(request, 'buy/buy.html', render_params, \
             context_instance=RequestContext(request))
 
+def buy_page_more(request):
+    ''' the next page of listing rows as a JSON fragment, for infinite scrolling '''
+    response = cached_listings(request, 'buy/listings_rows.html')
+    return HttpResponse(simplejson.dumps(response), mimetype="application/json")
+
+def buy_suggest(request):
+    ''' search bar suggestions for the words typed so far, as JSON '''
+    suggestions = [{'kind': kind, 'text': text} for kind, text in \
+            Item.suggest(request.GET.get('q', ''), SUGGESTION_LIMIT)]
+    return HttpResponse(simplejson.dumps({'suggestions': suggestions}), \
+            mimetype="application/json")
+
 def sell_page(request):
     if request.method == "POST":
         form = ItemForm(request.POST, request.FILES)
@@ -80,9 +250,10 @@ def dashboard_page(request):
 
     form = ReservationForm()
     render_params['form'] = form
-    render_params['reservations'] = get_current_user(request).get_reservations()
-    render_params['claims'] = get_current_user(request).get_claims()
-    render_params['items'] = get_current_user(request).get_items()
+    dashboard = load_dashboard(get_current_user(request))
+    render_params['reservations'] = dashboard.reservations
+    render_params['claims'] = dashboard.claims
+    render_params['items'] = dashboard.items
     return render(request, 'dashboard/dashboard.html', render_params, \
             context_instance=RequestContext(request))
 
@@ -96,14 +267,19 @@ def remove_item(request):
 def claim_listing(request):
     if request.method != 'POST':
         return redirect('data.views.buy_page')
-    item = Item.get_item_by_id(request.POST['item_id'])
-    get_current_user(request).add_claim(item)
-
     buyer = get_current_user(request)
-    item = Item.get_item_by_id(request.POST['item_id'])
-    item.seller_user.send_email(str(buyer) + ' wants to buy your ' + str(item) + '. Please contact your buyer at ' + buyer.email, '[Geddit] Buyer for ' + str(item))
-    
+    item = Item.get_item_with_seller(request.POST['item_id'])
     get_params = QueryDict('', mutable=True)
+    try:
+        buyer.add_claim(item)
+    except AssertionError:
+        # someone else got there first
+        get_params['message'] = "Sorry, this item has already been claimed."
+        return redirect(reverse('data.views.dashboard_page') + '?' + get_params.urlencode())
+    Notification.queue_notifications([Notification.new_email(item.seller_user, \
+            str(buyer) + ' wants to buy your ' + str(item) + '. Please contact your buyer at ' + buyer.email, \
+            '[Geddit] Buyer for ' + str(item))])
+
     get_params['message'] = "Item Claimed.  An email has been sent to the seller.  Please wait for them to contact you to coordinate the transaction."
     return redirect(reverse('data.views.dashboard_page') + '?' + get_params.urlencode())
 
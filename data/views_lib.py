@@ -1,12 +1,32 @@
-from data.models import Category
+from data.models import Category, Item
 from site_specific_constants import SITE_ROOT
 from site_specific_functions import get_current_user
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+CURSOR_TIME_FORMAT = '%Y%m%d%H%M%S%f'
 
 def base_params(request):
     return { \
-        'categories': Category.get_all_categories(), \
+        'categories': Category.get_cached_categories(), \
         'SITE_ROOT': SITE_ROOT, \
         'user': get_current_user(request), \
         'message': request.GET.get('message', None), \
     }
 
+def encode_cursor(cursor):
+    ''' turns an (upload_time or price, id) cursor into a URL parameter '''
+    value, id = cursor
+    if isinstance(value, datetime):
+        value = value.strftime(CURSOR_TIME_FORMAT)
+    return str(value) + '_' + str(id)
+
+def decode_cursor(value, sort=Item.NEWEST):
+    ''' the inverse of encode_cursor for a sort order, returns None for a malformed cursor '''
+    try:
+        value, id = value.split('_')
+        if Item.SORT_ORDERS[sort][0] == 'price':
+            return Decimal(value), int(id)
+        return datetime.strptime(value, CURSOR_TIME_FORMAT), int(id)
+    except (ValueError, InvalidOperation):
+        return None
@@ -1,7 +1,3 @@
-import subprocess
-import ldap
-import ldap.filter
-
 from django.contrib.auth.middleware import RemoteUserMiddleware
 from django.contrib.auth.backends import RemoteUserBackend
 from django.contrib.auth.views import login
@@ -10,13 +6,12 @@ from django.http import HttpResponseRedirect
 from django.contrib import auth
 from django.core.exceptions import ObjectDoesNotExist
 import settings
+from mit.directory import get_directory
+from mit.zwrite import get_notifier
 
 def zephyr(msg, clas='message', instance='log', rcpt='nobody',):
-    proc = subprocess.Popen(
-        ['zwrite', '-d', '-n', '-c', clas, '-i', instance, rcpt, ],
-        stdin=subprocess.PIPE, stdout=subprocess.PIPE
-    )
-    proc.communicate(msg)
+    ''' queues a zephyr for the background zwrite worker; never waits for it to be sent '''
+    return get_notifier().send(msg, clas, instance, rcpt)
 
 class ScriptsRemoteUserMiddleware(RemoteUserMiddleware):
     header = 'SSL_CLIENT_S_DN_Email'
@@ -32,29 +27,29 @@ class ScriptsRemoteUserBackend(RemoteUserBackend):
     def configure_user(self, user, ):
         username = user.username
         user.password = "ScriptsSSLAuth"
-        con = ldap.open('ldap-too.mit.edu')
-        con.simple_bind_s("", "")
-        dn = "dc=mit,dc=edu"
-        fields = ['cn', 'sn', 'givenName', 'mail', ]
-        userfilter = ldap.filter.filter_format('uid=%s', [username])
-        result = con.search_s('dc=mit,dc=edu', ldap.SCOPE_SUBTREE, userfilter, fields)
-        if len(result) == 1:
-            user.first_name = result[0][1]['givenName'][0]
-            user.last_name = result[0][1]['sn'][0]
-            user.email = result[0][1]['mail'][0]
-            try:
-                user.groups.add(auth.models.Group.objects.get(name='mit'))
-            except ObjectDoesNotExist:
-                print "Failed to retrieve mit group"
-        else:
-            raise ValueError, ("Could not find user with username '%s' (filter '%s')"%(username, userfilter))
-        try:
-            user.groups.add(auth.models.Group.objects.get(name='autocreated'))
-        except ObjectDoesNotExist:
-            print "Failed to retrieve autocreated group"
+        entry = get_directory().lookup(username)
+        if entry is None:
+            raise ValueError, ("Could not find user with username '%s'"%(username, ))
+        user.first_name = entry['givenName']
+        user.last_name = entry['sn']
+        user.email = entry['mail']
+        groups = get_groups()
+        for name in ('mit', 'autocreated'):
+            if name not in groups:
+                print "Failed to retrieve %s group" % name
+        user.groups.add(*groups.values())
         user.save()
         return user
 
+_groups = {}
+
+def get_groups():
+    ''' the ids of the groups every new user joins, by name, fetched once per process '''
+    if len(_groups) < 2:
+        _groups.update(auth.models.Group.objects.filter(name__in=['mit', 'autocreated']) \
+                .values_list('name', 'id'))
+    return dict(_groups)
+
 def scripts_login(request, **kwargs):
     host = request.META['HTTP_HOST'].split(':')[0]
     if host == 'localhost':
@@ -0,0 +1,183 @@
+import hashlib
+import threading
+
+from django.core.cache import cache
+
+from site_specific_constants import LDAP_HOST, LDAP_BASE, LDAP_POOL_SIZE, LDAP_CACHE_TTL
+
+# ldap.SCOPE_SUBTREE, so that python-ldap is only needed to really connect
+SCOPE_SUBTREE = 2
+
+FIELDS = ['uid', 'cn', 'sn', 'givenName', 'mail']
+
+# usernames per search when looking up a batch
+SEARCH_BATCH_SIZE = 50
+
+# cached in place of an entry for usernames that aren't in the directory
+NOT_FOUND = {}
+NOT_FOUND_TTL = 300
+
+def escape_filter(value):
+    ''' same as ldap.filter.escape_filter_chars '''
+    return ''.join('\\%02x' % ord(c) if c in '\\*()\x00' else c for c in value)
+
+def uid_filter(usernames):
+    filters = ['(uid=%s)' % escape_filter(username) for username in usernames]
+    if len(filters) == 1:
+        return filters[0]
+    return '(|%s)' % ''.join(filters)
+
+def ldap_connect(host):
+    import ldap
+    connection = ldap.initialize('ldap://' + host)
+    connection.simple_bind_s('', '')
+    return connection
+
+class DirectoryClient(object):
+    '''
+    looks people up in the MIT directory over a pool of anonymously bound
+    connections.
+
+    Entries (dicts of the first value of each attribute) are kept in the
+    Django cache for ttl seconds, and misses for NOT_FOUND_TTL, so a login
+    only waits on the directory the first time a username is seen.
+    lookup_many fetches a batch with one search per SEARCH_BATCH_SIZE
+    usernames, to warm the cache ahead of a rush of new users.
+    '''
+    def __init__(self, host=LDAP_HOST, base=LDAP_BASE, pool_size=LDAP_POOL_SIZE, \
+            ttl=LDAP_CACHE_TTL, connect=ldap_connect):
+        self.host = host
+        self.base = base
+        self.pool_size = pool_size
+        self.ttl = ttl
+        self.connect = connect
+        self.lock = threading.Lock()
+        self.idle = []
+        self.connections_opened = 0
+        self.searches = 0
+
+    def _acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+            self.connections_opened += 1
+        return self.connect(self.host)
+
+    def _release(self, connection):
+        with self.lock:
+            if len(self.idle) < self.pool_size:
+                self.idle.append(connection)
+                return
+        self._close(connection)
+
+    def _close(self, connection):
+        try:
+            connection.unbind_s()
+        except Exception:
+            pass
+
+    def search(self, usernames):
+        ''' the directory entries of usernames, by username, without the cache '''
+        connection = self._acquire()
+        try:
+            result = connection.search_s(self.base, SCOPE_SUBTREE, uid_filter(usernames), FIELDS)
+        except Exception:
+            # the server may have dropped an idle connection; try another once
+            self._close(connection)
+            connection = self._acquire()
+            try:
+                result = connection.search_s(self.base, SCOPE_SUBTREE, \
+                        uid_filter(usernames), FIELDS)
+            except Exception:
+                self._close(connection)
+                raise
+        self._release(connection)
+        with self.lock:
+            self.searches += 1
+
+        entries = {}
+        for dn, attributes in result:
+            entry = dict((name, values[0]) for name, values in attributes.items() if values)
+            if entry.get('uid', None) in usernames:
+                entries[entry['uid']] = entry
+        return entries
+
+    def make_key(self, username):
+        # memcached keys are short and can't hold spaces
+        return 'geddit:ldap:' + hashlib.md5(username.encode('utf-8')).hexdigest()
+
+    def lookup(self, username):
+        ''' the directory entry of username, or None if there is none '''
+        return self.lookup_many([username]).get(username, None)
+
+    def lookup_many(self, usernames):
+        ''' the directory entries of the usernames that have one, by username '''
+        usernames = list(set(usernames))
+        cached = cache.get_many([self.make_key(username) for username in usernames])
+        entries = {}
+        missing = []
+        for username in usernames:
+            entry = cached.get(self.make_key(username), None)
+            if entry is None:
+                missing.append(username)
+            elif entry != NOT_FOUND:
+                entries[username] = entry
+
+        for i in range(0, len(missing), SEARCH_BATCH_SIZE):
+            batch = missing[i:i + SEARCH_BATCH_SIZE]
+            found = self.search(batch)
+            cache.set_many(dict((self.make_key(username), entry) \
+                    for username, entry in found.items()), self.ttl)
+            cache.set_many(dict((self.make_key(username), NOT_FOUND) \
+                    for username in batch if username not in found), NOT_FOUND_TTL)
+            entries.update(found)
+        return entries
+
+class FakeConnection(object):
+    ''' answers the searches DirectoryClient makes from a FakeDirectory '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.open = True
+
+    def search_s(self, base, scope, filter, fields):
+        if not self.open or self.directory.down:
+            raise IOError("Can't contact LDAP server")
+        self.directory.searches.append(filter)
+        usernames = [part.split('=', 1)[1] for part in filter.strip('(|)').split(')(')]
+        return [('uid=%s,ou=users,%s' % (username, base), \
+                        dict((name, [value]) for name, value in \
+                                self.directory.entries[username].items() if name in fields)) \
+                for username in usernames if username in self.directory.entries]
+
+    def unbind_s(self):
+        self.open = False
+
+class FakeDirectory(object):
+    '''
+    an in-memory directory to connect DirectoryClient to in tests. Set down
+    to make every search fail.
+    '''
+    def __init__(self):
+        self.entries = {}
+        self.searches = []
+        self.connections = 0
+        self.down = False
+
+    def add(self, username, first_name, last_name, email):
+        self.entries[username] = {'uid': username, 'givenName': first_name, \
+                'sn': last_name, 'cn': first_name + ' ' + last_name, 'mail': email}
+
+    def connect(self, host):
+        self.connections += 1
+        return FakeConnection(self)
+
+_directory = None
+_directory_lock = threading.Lock()
+
+def get_directory():
+    ''' returns the process-wide directory client '''
+    global _directory
+    with _directory_lock:
+        if _directory is None:
+            _directory = DirectoryClient()
+        return _directory
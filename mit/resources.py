@@ -1,61 +1,227 @@
+import hashlib
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
 from tastypie.resources import ModelResource
 from tastypie import fields
-from geddit.data.models import User, Claim, Reservation, Category, Item
+from tastypie.authentication import Authentication
+from tastypie.authorization import ReadOnlyAuthorization
 from tastypie.constants import ALL, ALL_WITH_RELATIONS
+from tastypie.exceptions import BadRequest, Unauthorized
+from tastypie.paginator import Paginator
+from data.models import User, Claim, Reservation, Category, Item
+from data.media import etag_matches
+from site_specific_functions import get_current_user
+
+class CursorPaginator(Paginator):
+    '''
+    limit/offset paging, plus keyset paging for clients that walk a whole
+    collection: with after=<id> the page holds the objects below that id,
+    newest first, without counting the collection or scanning the offset.
+    meta.next_cursor is where a client switches from offsets to cursors.
+    '''
+    def _generate_cursor_uri(self, limit, after):
+        if self.resource_uri is None:
+            return None
+        request_params = self.request_data.copy()
+        for name in ('offset', 'limit', 'after'):
+            if name in request_params:
+                del request_params[name]
+        request_params.update({'limit': limit, 'after': after})
+        return '%s?%s' % (self.resource_uri, request_params.urlencode())
+
+    def page(self):
+        if 'after' not in self.request_data:
+            page = super(CursorPaginator, self).page()
+            objects = page[self.collection_name] = list(page[self.collection_name])
+            page['meta']['next_cursor'] = None
+            if page['meta'].get('next', None) and objects:
+                page['meta']['next_cursor'] = \
+                        self._generate_cursor_uri(page['meta']['limit'], objects[-1].id)
+            return page
+
+        if 'order_by' in self.request_data:
+            raise BadRequest('after can only be used with the default ordering.')
+        try:
+            after = int(self.request_data['after'])
+        except ValueError:
+            raise BadRequest("Invalid cursor '%s' provided." % self.request_data['after'])
+        limit = self.get_limit()
+        objects = list(self.objects.filter(id__lt=after)[:limit + 1])
+        meta = {
+            'limit': limit,
+            'after': after,
+            'previous': None,
+            'next': None,
+        }
+        if len(objects) > limit:
+            objects = objects[:limit]
+            meta['next'] = self._generate_cursor_uri(limit, objects[-1].id)
+        meta['next_cursor'] = meta['next']
+        return {
+            self.collection_name: objects,
+            'meta': meta,
+        }
+
+class CurrentUserAuthentication(Authentication):
+    ''' lets in the requests that get_current_user finds a Geddit user for '''
+    def is_authenticated(self, request, **kwargs):
+        try:
+            return get_current_user(request) is not None
+        except User.DoesNotExist:
+            return False
+
+    def get_identifier(self, request):
+        return get_current_user(request).username
+
+class OwnRowsAuthorization(ReadOnlyAuthorization):
+    ''' only shows the rows whose user_field is the requesting user '''
+    def __init__(self, user_field):
+        self.user_field = user_field
+
+    def read_list(self, object_list, bundle):
+        return object_list.filter(**{self.user_field: get_current_user(bundle.request)})
+
+    def read_detail(self, object_list, bundle):
+        if getattr(bundle.obj, self.user_field + '_id') != get_current_user(bundle.request).id:
+            raise Unauthorized('You are not allowed to access that resource.')
+        return True
 
-class UserResource(ModelResource):
+class GedditResource(ModelResource):
+    '''
+    read-only resource with sparse fields, expansion of related resources
+    and conditional GETs.
+
+    ?fields=name,price only returns those fields (and resource_uri).
+    ?expand=seller_user nests the related resource instead of linking to
+    it. Responses carry an ETag, and a matching If-None-Match gets an empty
+    304, so polling clients only download what changed.
+    '''
     class Meta:
-        queryset = User.objects.all()
+        allowed_methods = ['get']
+        paginator_class = CursorPaginator
+        limit = 20
+        max_limit = 100
+
+    def requested_fields(self, request, name):
+        if request is None or not request.GET.get(name, None):
+            return None
+        return set(field.strip() for field in request.GET[name].split(','))
+
+    def full_dehydrate(self, bundle, for_list=False):
+        only = self.requested_fields(bundle.request, 'fields')
+        expand = self.requested_fields(bundle.request, 'expand') or set()
+        for field_name, field_object in self.fields.items():
+            if only is not None and field_name not in only and field_name != 'resource_uri':
+                continue
+
+            if getattr(field_object, 'dehydrated_type', None) == 'related':
+                field_object.api_name = self._meta.api_name
+                field_object.resource_name = self._meta.resource_name
+
+            if field_name in expand and getattr(field_object, 'is_related', False) and \
+                    not getattr(field_object, 'is_m2m', False):
+                bundle.data[field_name] = self.expand_related(bundle, field_object)
+            else:
+                bundle.data[field_name] = field_object.dehydrate(bundle)
+
+            method = getattr(self, 'dehydrate_%s' % field_name, None)
+            if method:
+                bundle.data[field_name] = method(bundle)
+        return self.dehydrate(bundle)
+
+    def expand_related(self, bundle, field_object):
+        related = getattr(bundle.obj, field_object.attribute, None)
+        if related is None:
+            return None
+        resource = field_object.get_related_resource(related)
+        # nested resources aren't trimmed or expanded any further
+        return resource.full_dehydrate(resource.build_bundle(obj=related))
+
+    def create_response(self, request, data, response_class=HttpResponse, **response_kwargs):
+        response = super(GedditResource, self).create_response(request, data, \
+                response_class, **response_kwargs)
+        if request.method != 'GET' or response.status_code != 200:
+            return response
+
+        etag = '"%s"' % hashlib.md5(response.content).hexdigest()
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', None)
+        if if_none_match is not None and etag_matches(etag, if_none_match):
+            response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Cache-Control'] = 'max-age=0'
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+class UserResource(GedditResource):
+    class Meta(GedditResource.Meta):
+        queryset = User.objects.order_by('-id')
         resource_name = 'user'
-        excludes = ['email']
+        # contact details are only shared through claims, by email
+        fields = ['id', 'username', 'first_name', 'last_name']
         filtering = {
             "username": ALL,
         }
 
-class ItemResource(ModelResource):
-    #category = fields.ForeignKey(CategoryResource, 'category')
+class CategoryResource(GedditResource):
+    # a link to the category's items, which are paged like any other list
+    items = fields.CharField(readonly=True)
+
+    class Meta(GedditResource.Meta):
+        queryset = Category.objects.order_by('-id')
+        resource_name = 'category'
+        filtering = {
+            "name": ALL_WITH_RELATIONS,
+        }
+
+    def dehydrate_items(self, bundle):
+        return ItemResource().get_resource_uri() + '?category=' + str(bundle.obj.id)
+
+class ItemResource(GedditResource):
+    category = fields.ForeignKey(CategoryResource, 'category')
     seller_user = fields.ForeignKey(UserResource, 'seller_user')
-    
-    class Meta:
-        queryset = Item.objects.all()
-        resource_name = 'item'
-        excludes = ['resource_uri']
+    thumbnail_url = fields.CharField(attribute='thumbnail_url', readonly=True, null=True)
+    medium_url = fields.CharField(attribute='medium_url', readonly=True, null=True)
 
+    class Meta(GedditResource.Meta):
+        # the related rows are joined in, so expanding them costs no queries
+        queryset = Item.objects.select_related('category', 'seller_user').order_by('-id')
+        resource_name = 'item'
+        excludes = ['thumbnails_ready', 'thumbnails_version', 'thumbnails_failed']
+        ordering = ['upload_time', 'price']
         filtering = {
             "name": ALL,
+            "claimed": ALL,
+            "upload_time": ALL,
+            "price": ALL,
             "category": ALL_WITH_RELATIONS,
             "seller_user": ALL_WITH_RELATIONS
         }
-        
-class ClaimResource(ModelResource):
-    buyer = fields.ForeignKey(UserResource, 'user')
+
+class ClaimResource(GedditResource):
+    buyer = fields.ForeignKey(UserResource, 'buyer')
     item = fields.ForeignKey(ItemResource, 'item')
-    
-    class Meta:
-        queryset = Claim.objects.all()
+
+    class Meta(GedditResource.Meta):
+        queryset = Claim.objects.select_related('buyer', 'item').order_by('-id')
         resource_name = 'claim'
+        # who claimed what is only shown to the buyer
+        authentication = CurrentUserAuthentication()
+        authorization = OwnRowsAuthorization('buyer')
         filtering = {
             "buyer": ALL_WITH_RELATIONS,
             "item": ALL_WITH_RELATIONS,
         }
 
-class CategoryResource(ModelResource):
-    items = fields.ToManyField(ItemResource,
-        attribute=lambda bundle: Item.objects.filter(category=bundle.obj))
-    
-    class Meta:
-        queryset = Category.objects.all()
-        resource_name = 'category'
-        excludes = ['resource_uri']
-        filtering = {
-            "name": ALL_WITH_RELATIONS,
-        }
-
-class ReservationResource(ModelResource):
+class ReservationResource(GedditResource):
     user = fields.ToOneField(UserResource, 'user')
-    class Meta:
-        queryset = Reservation.objects.all()
+
+    class Meta(GedditResource.Meta):
+        queryset = Reservation.objects.select_related('user').order_by('-id')
         resource_name = 'filter'
+        # saved searches and prices are only shown to their owner
+        authentication = CurrentUserAuthentication()
+        authorization = OwnRowsAuthorization('user')
         filtering = {
             "user": ALL_WITH_RELATIONS,
         }
@@ -0,0 +1,139 @@
+import atexit
+import subprocess
+import threading
+import time
+import Queue
+
+from site_specific_constants import ZWRITE_COMMAND
+
+class ZephyrNotifier(object):
+    '''
+    sends zephyrs from a background thread, so that callers never wait on
+    zwrite.
+
+    send() only puts the message on a bounded queue; if the queue is full
+    the message is dropped and counted rather than blocking the caller.
+    The worker waits up to linger seconds for a burst to finish, then sends
+    the messages for each class, instance and recipient as one zephyr, one
+    line per message, so a burst costs one zwrite per destination instead
+    of one per line.
+    '''
+    def __init__(self, command=ZWRITE_COMMAND, max_queue=1000, batch_size=50, linger=0.2):
+        self.command = command
+        self.batch_size = batch_size
+        self.linger = linger
+        self.queue = Queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.sent = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._work)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def send(self, msg, clas='message', instance='log', rcpt='nobody'):
+        ''' returns False if the message had to be dropped '''
+        if self.thread is None:
+            self._start()
+        try:
+            self.queue.put_nowait((clas, instance, rcpt, msg))
+        except Queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def _take_batch(self):
+        ''' the next message, then whatever else arrives within linger seconds '''
+        batch = [self.queue.get()]
+        deadline = time.time() + self.linger
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            timeout = deadline - time.time()
+            try:
+                if timeout > 0:
+                    batch.append(self.queue.get(timeout=timeout))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._take_batch()
+            messages = [message for message in batch if message is not None]
+            try:
+                self._send_batch(messages)
+            finally:
+                for message in batch:
+                    self.queue.task_done()
+            if len(messages) < len(batch):
+                return
+
+    def _send_batch(self, messages):
+        # one zephyr per destination, in the order their first message came
+        destinations = []
+        lines = {}
+        for clas, instance, rcpt, msg in messages:
+            destination = (clas, instance, rcpt)
+            if destination not in lines:
+                destinations.append(destination)
+                lines[destination] = []
+            if isinstance(msg, unicode):
+                msg = msg.encode('utf-8')
+            lines[destination].append(msg.rstrip('\n'))
+
+        for destination in destinations:
+            clas, instance, rcpt = destination
+            try:
+                proc = subprocess.Popen(
+                    [self.command, '-d', '-n', '-c', clas, '-i', instance, rcpt, ],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                )
+                proc.communicate('\n'.join(lines[destination]))
+                ok = proc.returncode == 0
+            except Exception:
+                # whatever goes wrong with one zephyr, the worker keeps sending the rest
+                ok = False
+            with self.lock:
+                if ok:
+                    self.sent += len(lines[destination])
+                    self.batches += 1
+                else:
+                    self.failed += len(lines[destination])
+
+    def flush(self):
+        ''' waits until every queued message has been handled '''
+        if self.thread is not None:
+            self.queue.join()
+
+    def close(self):
+        ''' sends what is queued and stops the worker '''
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join()
+
+    def get_stats(self):
+        with self.lock:
+            return {'sent': self.sent, 'batches': self.batches, 'dropped': self.dropped, \
+                    'failed': self.failed, 'queued': self.queue.qsize()}
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+def get_notifier():
+    ''' returns the process-wide notifier, which sends what is queued on exit '''
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = ZephyrNotifier()
+            atexit.register(_notifier.close)
+        return _notifier
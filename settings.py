@@ -1,4 +1,6 @@
 # Django settings for geddit project.
+import os
+import sys
 
 DEBUG = True
 TEMPLATE_DEBUG = DEBUG
@@ -52,6 +54,17 @@ MEDIA_ROOT = '/home/pwh/workspace/geddit/media/'
 # Examples: "http://media.lawrence.com/media/", "http://example.com/media/"
 MEDIA_URL = '/media/'
 
+# How /media/ files are sent: 'stream' reads them in Python (development
+# only), 'x-sendfile' (Apache mod_xsendfile, lighttpd) or 'x-accel-redirect'
+# (nginx) hand the file to the front-end server.
+MEDIA_SERVE_MODE = 'stream'
+# The nginx internal location that maps to MEDIA_ROOT, for 'x-accel-redirect'.
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Uploads get a new name rather than being changed in place, and resized
+# copies get a new version when they are regenerated, so browsers may keep
+# them for a year.
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
 # Absolute path to the directory static files should be collected to.
 # Don't put anything in this directory yourself; store your static files
 # in apps' "static/" subdirectories and in STATICFILES_DIRS.
@@ -99,13 +112,44 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'data.middleware.ProfilingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'data.middleware.CurrentUserMiddleware',
 )
 
+# Cache versions and rendered listings must be seen by every process, so
+# the cache has to be shared.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+    }
+}
+# The test runner and the development server are the only process, where
+# the in-memory cache is as good as a shared one. With SINGLE_PROCESS
+# False, rendered fragments are not cached in a process-local cache.
+SINGLE_PROCESS = len(sys.argv) > 1 and sys.argv[1] in ('test', 'runserver')
+if SINGLE_PROCESS:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# The fraction of requests whose SQL, template and view time are sent back
+# in a Server-Timing header and logged to data.profiling. 0 turns
+# profiling off entirely.
+PROFILING_SAMPLE_RATE = 0
+# How many of a profiled request's slowest statements are logged.
+PROFILING_SLOW_QUERIES = 3
+
+# The addresses allowed to scrape /metrics.
+METRICS_ALLOWED_IPS = ('127.0.0.1',)
+
 AUTHENTICATION_BACKENDS = (
     'django.contrib.auth.backends.ModelBackend',
 )
@@ -117,7 +161,8 @@ TEMPLATE_DIRS = (
     # Always use forward slashes, even on Windows.
     # Don't forget to use absolute paths, not relative paths.
     '/home/kerry/geddit/templates',
-    '/home/pwh/workspace/geddit/templates'
+    '/home/pwh/workspace/geddit/templates',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'),
 )
 
 INSTALLED_APPS = (
@@ -146,6 +191,10 @@ LOGGING = {
         'mail_admins': {
             'level': 'ERROR',
             'class': 'django.utils.log.AdminEmailHandler'
+        },
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler'
         }
     },
     'loggers': {
@@ -154,5 +203,10 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'data.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     }
 }
@@ -3,3 +3,23 @@ SITE_ROOT = 'http://127.0.0.1:8000/'
 GEDDIT_GMAIL = 'awib5dche9di@gmail.com'
 GEDDIT_PASSWORD = ''
 
+
+SMTP_HOST = 'localhost'
+SMTP_PORT = 25
+
+# 'googlevoice', or 'stub' to keep text messages in memory
+SMS_BACKEND = 'googlevoice'
+# seconds before the Google Voice session is renewed
+SMS_SESSION_TTL = 3600
+# text messages sent per second
+SMS_RATE_LIMIT = 1.0
+
+LDAP_HOST = 'ldap-too.mit.edu'
+LDAP_BASE = 'dc=mit,dc=edu'
+# idle directory connections kept open
+LDAP_POOL_SIZE = 4
+# seconds a directory entry is cached
+LDAP_CACHE_TTL = 24 * 60 * 60
+
+# the program mit.zephyr sends zephyrs with
+ZWRITE_COMMAND = 'zwrite'
@@ -1,5 +1,11 @@
 from data.models import User
 
-def get_current_user(request):
+def lookup_current_user(request):
+    ''' fetches the user making the request from the database '''
     return User.get_user('pwh')
 
+def get_current_user(request):
+    ''' returns the user making the request, looked up at most once per request '''
+    if not hasattr(request, '_cached_current_user'):
+        request._cached_current_user = lookup_current_user(request)
+    return request._cached_current_user
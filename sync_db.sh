@@ -1,4 +1,4 @@
 python manage.py sqlclear data | python manage.py dbshell
-python manage.py sql data | python manage.py dbshell
-cat initial_data.py | python manage.py shell
+python manage.py sqlall data | python manage.py dbshell
+python manage.py load_data data/seed/initial_data.jsonl
 
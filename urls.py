@@ -1,22 +1,20 @@
 from django.conf.urls.defaults import patterns, include, url
 from django.contrib.auth.views import login, logout
 
-#from tastypie.api import Api
-#from geddit.api.resources import UserResource, ItemResource, ClaimResource, CategoryResource, ReservationResource
+from tastypie.api import Api
+from mit.resources import UserResource, ItemResource, ClaimResource, CategoryResource, ReservationResource
 # Uncomment the next two lines to enable the admin:
 from django.contrib import admin
 import settings
 
 admin.autodiscover()
 
-'''
 v1_api = Api(api_name='v1')
 v1_api.register(UserResource())
 v1_api.register(ClaimResource())
 v1_api.register(ItemResource())
 v1_api.register(CategoryResource())
 v1_api.register(ReservationResource())
-'''
 
 urlpatterns = patterns('',
     # Examples:
@@ -30,10 +28,12 @@ urlpatterns = patterns('',
     # Uncomment the next line to enable the admin:
     url(r'^admin/', include(admin.site.urls)),
     #url(r'^jstest/', 'jstest.views.index'),
-    #url(r'^api/', include(v1_api.urls)),
+    url(r'^api/', include(v1_api.urls)),
     url(r'^$', 'data.views.buy_page'),
 
     url(r'^buy$', 'data.views.buy_page'),    
+    url(r'^buy/more$', 'data.views.buy_page_more'),
+    url(r'^buy/suggest$', 'data.views.buy_suggest'),
     url(r'^sell$', 'data.views.sell_page'),
     url(r'^dashboard$', 'data.views.dashboard_page'),
     url(r'^settings$', 'data.views.settings_page'),
@@ -45,7 +45,10 @@ urlpatterns = patterns('',
     url(r'^unclaim$', 'data.views.unclaim_listing'),
     #url(r'^email_seller$', 'data.views.email_seller'),
 
-    url(r'^media/(?P<path>.*)$', 'django.views.static.serve', {
+    url(r'^metrics$', 'data.metrics.serve_metrics'),
+    url(r'^export/(?P<kind>\w+)\.(?P<format>\w+)$', 'data.export.serve_export'),
+
+    url(r'^media/(?P<path>.*)$', 'data.media.serve_media', {
             'document_root': settings.MEDIA_ROOT,
         }),
 